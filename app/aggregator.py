@@ -0,0 +1,131 @@
+import numpy as np
+
+FIELDS = (
+    "cpu_load",
+    "memory_total",
+    "memory_used",
+    "network_in",
+    "network_out",
+    "reads",
+    "writes",
+    "read_bytes",
+    "write_bytes",
+    "io_ops",
+)
+METRIC_FIELDS = {
+    "cpu": ["cpu_load"],
+    "memory": ["memory_total", "memory_used"],
+    "network": ["network_in", "network_out"],
+    "diskio": ["reads", "writes", "read_bytes", "write_bytes", "io_ops"],
+}
+METRICS = list(METRIC_FIELDS)
+INITIAL_NODES = 64
+
+
+# Keeps the latest contribution of every node in one row of a NumPy array and
+# the cluster totals next to it; a new sample only moves the totals by the
+# difference to the node's previous contribution
+class ClusterAggregator:
+    def __init__(self, capacity=INITIAL_NODES):
+        self.columns = {
+            metric: [FIELDS.index(field) for field in fields]
+            for metric, fields in METRIC_FIELDS.items()
+        }
+        self.values = np.zeros((capacity, len(FIELDS)))
+        self.reporting = np.zeros((capacity, len(METRICS)), dtype=bool)
+        self.totals = np.zeros(len(FIELDS))
+        self.counts = np.zeros(len(METRICS), dtype=int)
+        self.slots = {}
+        self.free_slots = list(range(capacity - 1, -1, -1))
+
+    def get_slot(self, node):
+        slot = self.slots.get(node)
+        if slot is None:
+            if not self.free_slots:
+                self.grow()
+            slot = self.free_slots.pop()
+            self.slots[node] = slot
+        return slot
+
+    def grow(self):
+        capacity = len(self.values)
+        self.values = np.vstack([self.values, np.zeros_like(self.values)])
+        self.reporting = np.vstack([self.reporting, np.zeros_like(self.reporting)])
+        self.free_slots.extend(range(2 * capacity - 1, capacity - 1, -1))
+
+    def contribution(self, metric, result):
+        if metric == "cpu":
+            _, cpu_metrics = result
+            return [cpu_metrics["cpu_load"]]
+        if metric == "memory":
+            _, memory_metrics, _ = result
+            return [memory_metrics["total"], memory_metrics["used"]]
+        if metric == "network":
+            _, network_metrics = result
+            return np.sum(list(network_metrics.values()), axis=0) if network_metrics else [0, 0]
+        _, diskio_metrics = result
+        return np.sum(list(diskio_metrics.values()), axis=0) if diskio_metrics else [0] * 5
+
+    # Nodes are keyed by whatever the caller reports them under (the node
+    # card), which stays valid when a node's host or user is edited
+    def record(self, node, metric, result):
+        if metric not in self.columns:
+            return
+
+        slot = self.get_slot(node)
+        columns = self.columns[metric]
+        index = METRICS.index(metric)
+
+        # A failed sample takes the node out of the totals until it reports again
+        if result is None:
+            new_values = np.zeros(len(columns))
+        else:
+            new_values = self.contribution(metric, result)
+        self.totals[columns] += new_values - self.values[slot, columns]
+        self.values[slot, columns] = new_values
+
+        reporting = result is not None
+        if reporting != self.reporting[slot, index]:
+            self.counts[index] += 1 if reporting else -1
+            self.reporting[slot, index] = reporting
+
+    def remove(self, node):
+        slot = self.slots.pop(node, None)
+        if slot is None:
+            return
+
+        self.values[slot] = 0
+        self.reporting[slot] = False
+        self.free_slots.append(slot)
+        # Recount from the rows so rounding errors of the running sums do not
+        # pile up over many added and removed nodes
+        self.totals = self.values.sum(axis=0)
+        self.counts = self.reporting.sum(axis=0)
+
+    def cpu_percentiles(self):
+        loads = self.values[self.reporting[:, METRICS.index("cpu")], FIELDS.index("cpu_load")]
+        if not len(loads):
+            return 0, 0, 0
+        p50, p95 = np.percentile(loads, [50, 95])
+        return p50, p95, loads.max()
+
+    def summary(self):
+        totals = dict(zip(FIELDS, self.totals))
+        cpu_count = self.counts[METRICS.index("cpu")]
+        p50, p95, cpu_max = self.cpu_percentiles()
+
+        return {
+            "total_memory": totals["memory_total"] / 1024,
+            "used_memory": totals["memory_used"] / 1024,
+            "cpu_usage": totals["cpu_load"] / cpu_count if cpu_count > 0 else 0,
+            "cpu_p50": p50,
+            "cpu_p95": p95,
+            "cpu_max": cpu_max,
+            "network_in": totals["network_in"],
+            "network_out": totals["network_out"],
+            "total_reads": totals["reads"],
+            "total_writes": totals["writes"],
+            "total_read_bytes": totals["read_bytes"],
+            "total_write_bytes": totals["write_bytes"],
+            "total_iops": totals["io_ops"],
+        }
@@ -2,19 +2,27 @@ import asyncio
 import tkinter as tk
 from tkinter import ttk, filedialog
 import threading
-import json
-import os
+import time
 from metrics import (
     get_ssh_connection,
     close_ssh_connection,
+    watch_reconnect,
+    unwatch_reconnect,
 )
 from detail_window import DetailWindow
+from internals_window import InternalsWindow
+from instrumentation import instrumentation
+from aggregator import ClusterAggregator
 from node_card import NodeCard, FailedNodeCard
 from add_edit_node_window import AddNodeWindow
 import warnings
 from asyncio_tkinter import AsyncTk
-import nest_asyncio
-nest_asyncio.apply()
+from config import (
+    DEFAULT_CONFIG_FILE,
+    MAX_CONCURRENT_CONNECTIONS,
+    load_nodes,
+    save_nodes,
+)
 
 warnings.filterwarnings(
     "ignore",
@@ -22,11 +30,11 @@ warnings.filterwarnings(
     message="Attempting to set identical low and high ylims makes transformation singular; automatically expanding.",
 )
 
-DEFAULT_CONFIG_FILE = "configs/nodes_config.json"
-
 
 class App(AsyncTk):
-    def __init__(self):
+    def __init__(
+        self, exporter=None, history_store=None, max_concurrency=MAX_CONCURRENT_CONNECTIONS
+    ):
         super().__init__()
         self.title("Cluster Monitor")
         self.geometry("880x600")
@@ -36,7 +44,13 @@ class App(AsyncTk):
         self.node_cards = []
         self.node_info_list = self.load_nodes()
         self.detail_windows = {}
+        self.internals_window = None
+        self.aggregator = ClusterAggregator()
+        self.exporter = exporter
+        self.history_store = history_store
+        self.max_concurrency = max_concurrency
         self.lock = threading.Lock()
+        self.grid_refresh_pending = False
 
         self.create_widgets()
         self.bind("<Configure>", self.on_resize)
@@ -47,102 +61,30 @@ class App(AsyncTk):
         # Ensure the event loop stops when the File > Exit menu is clicked
         self.file_menu.add_command(label="Exit", command=self.on_exit)
 
-        asyncio.ensure_future(self.initialize_nodes())
+        asyncio.ensure_future(self.initialize_nodes(self.max_concurrency))
         asyncio.ensure_future(self.update_cumulative_metrics())
+        if self.exporter:
+            asyncio.ensure_future(self.exporter.start())
+        if self.history_store:
+            self.history_store.start()
     
     def on_exit(self):
-        # Cancel all asyncio tasks
-        for task in asyncio.all_tasks():
+        # Cancel all asyncio tasks, they are awaited once the mainloop returns
+        for task in asyncio.all_tasks(self._loop):
             task.cancel()
 
-        # Stop the event loop
+        # Samples still buffered for the history are written before exiting
+        if self.history_store:
+            try:
+                self.history_store.close()
+            except Exception as e:
+                print(f"Error closing the history store: {e}")
+
+        # Stop the Tk mainloop that drives the event loop
         self.quit()
-        self._loop.stop()
         self.destroy()
 
-    async def get_cumulative_metrics(self):
-        total_memory = 0
-        used_memory = 0
-        total_cpu_usage = 0
-        total_network_in = 0
-        total_network_out = 0
-        total_reads = 0
-        total_writes = 0
-        total_read_bytes = 0
-        total_write_bytes = 0
-        total_iops = 0
-        normal_node_count = 0
-    
-        for card in self.node_cards:
-            if isinstance(card, NodeCard):
-                detail_window = self.detail_windows.get(card.node_info["name"])
-                if detail_window and detail_window.winfo_exists():
-                    metrics = detail_window.get_latest_metrics()
-                    if metrics["cpu"] and metrics["memory"]:
-                        total_memory += metrics["memory"]["total"]
-                        used_memory += metrics["memory"]["used"]
-                        total_cpu_usage += metrics["cpu"]["cpu_load"]
-                        normal_node_count += 1
-    
-                    if metrics["network"]:
-                        for interface in metrics["network"].values():
-                            in_speed, out_speed = (
-                                interface["bytes_in/s"],
-                                interface["bytes_out/s"],
-                            )
-                            total_network_in += self.convert_to_kbps(in_speed)
-                            total_network_out += self.convert_to_kbps(out_speed)
-    
-                    if metrics["diskio"]:
-                        for device_metrics in metrics["diskio"].values():
-                            total_reads += device_metrics["reads/s"]
-                            total_writes += device_metrics["writes/s"]
-                            total_read_bytes += self.convert_to_bytes(
-                                device_metrics["read_bytes/s"]
-                            )
-                            total_write_bytes += self.convert_to_bytes(
-                                device_metrics["write_bytes/s"]
-                            )
-                            total_iops += device_metrics["io_ops/s"]
-    
-        avg_cpu_usage = (
-            total_cpu_usage / normal_node_count if normal_node_count > 0 else 0
-        )
-    
-        total_memory_gb = total_memory / 1024
-        used_memory_gb = used_memory / 1024
-    
-        return {
-            "total_memory": total_memory_gb,
-            "used_memory": used_memory_gb,
-            "cpu_usage": avg_cpu_usage,
-            "network_in": total_network_in,
-            "network_out": total_network_out,
-            "total_reads": total_reads,
-            "total_writes": total_writes,
-            "total_read_bytes": self.format_disk_io_speed(total_read_bytes),
-            "total_write_bytes": self.format_disk_io_speed(total_write_bytes),
-            "total_iops": total_iops,
-        }
-
-    def format_network_speed(self, speed_kbps):
-        if speed_kbps >= 1024:
-            return f"{speed_kbps / 1024:.2f} MB/s"
-        else:
-            return f"{speed_kbps:.2f} KB/s"
-
-    def convert_to_kbps(self, speed):
-        value, unit = speed.split()
-        value = float(value)
-        unit_multipliers = {
-            "B/s": 1 / 1024,
-            "KB/s": 1,
-            "MB/s": 1024,
-            "GB/s": 1024 * 1024,
-        }
-        return value * unit_multipliers[unit]
-
-    def format_disk_io_speed(self, speed):
+    def format_speed(self, speed):
         if speed >= 1024**3:
             return f"{speed / 1024 ** 3:.2f} GB/s"
         elif speed >= 1024**2:
@@ -152,57 +94,36 @@ class App(AsyncTk):
         else:
             return f"{speed:.2f} B/s"
 
-    def convert_to_bytes(self, value):
-        value, unit = value.split()
-        value = float(value)
-        if unit == "KB/s":
-            return value * 1024
-        elif unit == "MB/s":
-            return value * 1024 * 1024
-        elif unit == "GB/s":
-            return value * 1024 * 1024 * 1024
-        return value
-
     def update_metrics_labels(self, metrics):
-        self.cumulative_cpu_label.config(text=f"CPU Usage: {metrics['cpu_usage']:.2f}%")
+        self.cumulative_cpu_label.config(
+            text=f"CPU Usage: {metrics['cpu_usage']:.2f}% (p50: {metrics['cpu_p50']:.2f}%, "
+            f"p95: {metrics['cpu_p95']:.2f}%, max: {metrics['cpu_max']:.2f}%)"
+        )
         self.cumulative_memory_label.config(
             text=f"Memory: {metrics['used_memory']:.2f} GB / {metrics['total_memory']:.2f} GB"
         )
         self.cumulative_network_label.config(
-            text=f"Network In: {self.format_network_speed(metrics['network_in'])}, Out: {self.format_network_speed(metrics['network_out'])}"
+            text=f"Network In: {self.format_speed(metrics['network_in'])}, Out: {self.format_speed(metrics['network_out'])}"
         )
         self.cumulative_diskio_label.config(
             text=f"Disk I/O - Reads/s: {metrics['total_reads']:.2f} , Writes/s: {metrics['total_writes']:.2f} , "
-            f"Read Bytes: {metrics['total_read_bytes']}, Write Bytes: {metrics['total_write_bytes']} "
-            f"IOPS: {metrics['total_iops']}"
+            f"Read Bytes: {self.format_speed(metrics['total_read_bytes'])}, Write Bytes: {self.format_speed(metrics['total_write_bytes'])} "
+            f"IOPS: {metrics['total_iops']:.2f}"
         )
 
     async def update_cumulative_metrics(self):
         while True:
             try:
-                metrics = await self.get_cumulative_metrics()
-                if metrics:
-                    self.after(0, self.update_metrics_labels, metrics)
+                self.update_metrics_labels(self.aggregator.summary())
             except Exception as e:
                 print(f"Error updating metrics: {e}")
             await asyncio.sleep(1)
             
     def load_nodes(self):
-        try:
-            if not os.path.exists(self.current_config_file):
-                return []
-
-            with open(self.current_config_file, "r") as f:
-                nodes = json.load(f)
-                if not nodes:
-                    return []
-                return nodes
-        except (FileNotFoundError, json.JSONDecodeError):
-            return []
+        return load_nodes(self.current_config_file)
 
     def save_nodes(self):
-        with open(self.current_config_file, "w") as f:
-            json.dump(self.node_info_list, f, indent=4)
+        save_nodes(self.current_config_file, self.node_info_list)
 
     def create_widgets(self):
         self.menu_bar = tk.Menu(self)
@@ -221,6 +142,10 @@ class App(AsyncTk):
         )
         self.file_menu.add_separator()
 
+        self.view_menu = tk.Menu(self.menu_bar, tearoff=0)
+        self.menu_bar.add_cascade(label="View", menu=self.view_menu)
+        self.view_menu.add_command(label="Internals", command=self.show_internals)
+
         self.cumulative_memory_label = tk.Label(self, text="Memory: N/A")
         self.cumulative_memory_label.pack()
 
@@ -239,6 +164,12 @@ class App(AsyncTk):
         self.add_button = tk.Button(self, text="Add Node", command=self.add_node)
         self.add_button.pack()
 
+        self.progress_label = tk.Label(self, text="")
+        self.progress_label.pack()
+        self.progress_bar = ttk.Progressbar(
+            self, orient="horizontal", length=300, mode="determinate"
+        )
+
         self.canvas = tk.Canvas(self)
         self.scrollbar = ttk.Scrollbar(
             self, orient="vertical", command=self.canvas.yview
@@ -261,10 +192,39 @@ class App(AsyncTk):
         self.grid_frame.columnconfigure(0, weight=1)
         self.grid_frame.rowconfigure(0, weight=1)
 
-    async def initialize_nodes(self):
+    async def initialize_nodes(self, max_concurrency=MAX_CONCURRENT_CONNECTIONS):
         self.node_info_list.sort(key=lambda x: x["name"].lower())
-        for node_info in self.node_info_list:
-            await self.add_node_card(node_info)
+        total = len(self.node_info_list)
+        if not total:
+            return
+
+        semaphore = asyncio.Semaphore(max_concurrency)
+        start_time = time.monotonic()
+        completed = 0
+        self.update_progress(completed, total)
+
+        async def connect_node(node_info):
+            nonlocal completed
+            async with semaphore:
+                await self.add_node_card(node_info)
+            completed += 1
+            self.update_progress(completed, total)
+
+        await asyncio.gather(
+            *(connect_node(node_info) for node_info in self.node_info_list),
+            return_exceptions=True,
+        )
+
+        elapsed = time.monotonic() - start_time
+        print(f"Initialized {total} nodes in {elapsed:.2f} seconds")
+        self.progress_bar.pack_forget()
+        self.progress_label.config(text=f"Loaded {total} nodes in {elapsed:.2f} s")
+
+    def update_progress(self, completed, total):
+        if not self.progress_bar.winfo_manager():
+            self.progress_bar.pack(after=self.progress_label)
+        self.progress_bar.config(maximum=total, value=completed)
+        self.progress_label.config(text=f"Connecting to nodes: {completed}/{total}")
 
     async def add_node_card(self, node_info):
         card_width = 200
@@ -282,10 +242,6 @@ class App(AsyncTk):
                 width=card_width,
                 height=card_height,
             )
-            self.node_cards.append(card)
-            self.refresh_grid()
-            if node_info["name"] not in self.detail_windows:
-                self.detail_windows[node_info["name"]] = DetailWindow(self, node_info)
         else:
             card = FailedNodeCard(
                 self.grid_frame,
@@ -297,8 +253,11 @@ class App(AsyncTk):
                 width=card_width,
                 height=card_height,
             )
-            self.node_cards.append(card)
-            self.refresh_grid()
+            watch_reconnect(node_info, self.replace_failed_node_with_normal_node)
+        # Connections finish in any order, keep the grid sorted by name
+        self.node_cards.append(card)
+        self.node_cards.sort(key=lambda c: c.node_info["name"].lower())
+        self.schedule_refresh_grid()
 
     async def reconnect_node(self, node_info):
         await close_ssh_connection(node_info)
@@ -330,12 +289,14 @@ class App(AsyncTk):
                 failed_card.grid(padx=10, pady=10, sticky="nsew")
                 self.node_cards.append(failed_card)
                 self.refresh_grid()
+                watch_reconnect(node_info, self.replace_failed_node_with_normal_node)
             else:
                 print(f"Node card for {node_info['name']} is not in the node_cards list.")
 
 
 
     def replace_failed_node_with_normal_node(self, node_info):
+        unwatch_reconnect(node_info)
         with self.lock:
             failed_node_card = None
             for card in self.node_cards:
@@ -362,18 +323,17 @@ class App(AsyncTk):
                 self.node_cards.append(card)
                 self.refresh_grid()
                 #asyncio.ensure_future(self.add_node_card(node_info))
-                if node_info["name"] not in self.detail_windows:
-                    self.detail_windows[node_info["name"]] = DetailWindow(self, node_info)
 
     def update_node_info(self, old_info, new_info):
+        # The old settings are updated in place, close their connection first
+        asyncio.ensure_future(close_ssh_connection(dict(old_info)))
+
         for node in self.node_info_list:
             if node == old_info:
                 node.update(new_info)
 
         self.save_nodes()
 
-        close_ssh_connection(old_info)
-
         if old_info["name"] in self.detail_windows:
             self.detail_windows[old_info["name"]].destroy()
             del self.detail_windows[old_info["name"]]
@@ -390,16 +350,18 @@ class App(AsyncTk):
                 else:
                     self.handle_failed_node(card)
 
-        if reconnected:
-            self.detail_windows[new_info["name"]] = DetailWindow(self, new_info)
-
         self.refresh_nodes()
 
     def remove_node(self, node_info):
         self.node_info_list = [
             node for node in self.node_info_list if node != node_info
         ]
-        close_ssh_connection(node_info)
+        asyncio.ensure_future(close_ssh_connection(node_info))
+        unwatch_reconnect(node_info)
+        instrumentation.remove_node(node_info["name"])
+        if node_info["name"] in self.detail_windows:
+            self.detail_windows[node_info["name"]].destroy()
+            del self.detail_windows[node_info["name"]]
         self.save_nodes()
         self.refresh_nodes()
 
@@ -408,6 +370,7 @@ class App(AsyncTk):
 
     def clear_nodes(self):
         for card in self.node_cards:
+            unwatch_reconnect(card.node_info)
             card.destroy()
         self.node_cards.clear()
 
@@ -425,7 +388,7 @@ class App(AsyncTk):
             self.current_config_file = file_path
             self.node_info_list = self.load_nodes()
             self.node_info_list.sort(key=lambda x: x["name"].lower())
-            asyncio.ensure_future(self.initialize_nodes())
+            asyncio.ensure_future(self.initialize_nodes(self.max_concurrency))
             self.refresh_grid()
 
     def save_config_as(self):
@@ -480,7 +443,14 @@ class App(AsyncTk):
 
         self.refresh_grid()
 
+    def schedule_refresh_grid(self):
+        # Coalesce the grid refreshes of many cards arriving at once
+        if not self.grid_refresh_pending:
+            self.grid_refresh_pending = True
+            self.after_idle(self.refresh_grid)
+
     def refresh_grid(self):
+        self.grid_refresh_pending = False
         card_width = 200
         card_height = 150
         num_columns = max(1, self.winfo_width() // (card_width + 20))
@@ -499,11 +469,22 @@ class App(AsyncTk):
     def on_resize(self, event):
         self.refresh_grid()
 
-    def show_details(self, node_info):
-        detail_window = self.detail_windows[node_info["name"]]
+    def show_details(self, node_card):
+        node_info = node_card.node_info
+        detail_window = self.detail_windows.get(node_info["name"])
+        if detail_window is None or not detail_window.winfo_exists():
+            # Windows are built on first use and filled from the card's history
+            detail_window = DetailWindow(self, node_info, node_card.history)
+            self.detail_windows[node_info["name"]] = detail_window
         detail_window.deiconify()
         detail_window.lift()
         #detail_window.state("zoomed")
 
+    def show_internals(self):
+        if self.internals_window is None or not self.internals_window.winfo_exists():
+            self.internals_window = InternalsWindow(self)
+        self.internals_window.deiconify()
+        self.internals_window.lift()
+
     def on_close_detail_window(self, node_info):
         self.detail_windows[node_info["name"]].withdraw()
\ No newline at end of file
@@ -1,38 +1,155 @@
 import asyncio
+import heapq
+import selectors
 import tkinter as tk
 
+
+class TkEventLoop(asyncio.SelectorEventLoop):
+    # Reports every callback and timer that gets scheduled, so Tk knows when
+    # asyncio has work instead of having to poll for it
+    def __init__(self, selector, on_schedule):
+        self._on_schedule = on_schedule
+        super().__init__(selector)
+
+    def call_soon(self, callback, *args, context=None):
+        handle = super().call_soon(callback, *args, context=context)
+        self._on_schedule(None)
+        return handle
+
+    def call_at(self, when, callback, *args, context=None):
+        handle = super().call_at(when, callback, *args, context=context)
+        self._on_schedule(when)
+        return handle
+
+    def _process_self_data(self, data):
+        # A wakeup from call_soon_threadsafe can be drained by the same step
+        # that has already counted its ready callbacks, so run one more step
+        super()._process_self_data(data)
+        self._on_schedule(None)
+
+
+# Tk runs its own mainloop and steps asyncio only when there is something to
+# do: when the selector has ready I/O (including call_soon_threadsafe wakeups),
+# when a callback is scheduled or when the next timer is due
 class AsyncTk:
     def __init__(self, interval=0.05):
         self._root = tk.Tk()
         self._interval = interval
-        self._loop = asyncio.get_event_loop()
-        self._loop.create_task(self._periodic_call())
-    
-    async def _periodic_call(self):
-        while True:
-            self._root.update()
-            await asyncio.sleep(self._interval)
-    
+        self._closing = False
+        self._step_pending = None
+        self._deadlines = []
+        self._timer = None
+        self._selector = selectors.DefaultSelector()
+        self._loop = TkEventLoop(self._selector, self._schedule_step)
+        asyncio.set_event_loop(self._loop)
+
+        try:
+            self._root.tk.createfilehandler(
+                self._selector.fileno(), tk.READABLE, self._on_readable
+            )
+        except (AttributeError, NotImplementedError):
+            # No file handlers on Windows and no pollable fd for select(),
+            # fall back to stepping the loop at a fixed interval there
+            self._root.after(int(self._interval * 1000), self._poll)
+
+    def _on_readable(self, fileno, mask):
+        self._run_once()
+
+    def _poll(self):
+        self._run_once()
+        if not self._closing:
+            self._root.after(int(self._interval * 1000), self._poll)
+
+    def _schedule_step(self, when):
+        if self._closing:
+            return
+
+        if when is None:
+            if self._step_pending is None:
+                self._step_pending = self._root.after(0, self._run_pending)
+            return
+
+        heapq.heappush(self._deadlines, when)
+        self._arm_timer()
+
+    def _arm_timer(self):
+        if not self._deadlines:
+            return
+
+        deadline = self._deadlines[0]
+        if self._timer is not None:
+            if self._timer[0] <= deadline:
+                return
+            self._root.after_cancel(self._timer[1])
+
+        delay = max(0, deadline - self._loop.time())
+        # Round up so the timer is due by the time the step runs
+        after_id = self._root.after(int(delay * 1000) + 1, self._on_timer)
+        self._timer = (deadline, after_id)
+
+    def _run_pending(self):
+        self._step_pending = None
+        self._run_once()
+
+    def _on_timer(self):
+        self._timer = None
+        now = self._loop.time()
+        while self._deadlines and self._deadlines[0] <= now:
+            heapq.heappop(self._deadlines)
+
+        self._run_once()
+        if not self._closing:
+            self._arm_timer()
+
+    def _run_once(self):
+        # Stopping before run_forever polls the selector once without
+        # blocking, runs everything that is ready and returns
+        if self._loop.is_running() or self._loop.is_closed():
+            return
+        self._loop.stop()
+        self._loop.run_forever()
+
+    def _shutdown(self):
+        self._closing = True
+        if self._loop.is_closed():
+            return
+
+        tasks = asyncio.all_tasks(self._loop)
+        for task in tasks:
+            task.cancel()
+        self._loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+        self._loop.run_until_complete(self._loop.shutdown_asyncgens())
+        self._loop.close()
+
     def mainloop(self):
         try:
-            self._loop.run_forever()
+            self._root.mainloop()
         except KeyboardInterrupt:
             pass
         finally:
-            self._loop.run_until_complete(self._loop.shutdown_asyncgens())
-            self._loop.close()
-    
+            self._shutdown()
+
     def __getattr__(self, name):
         return getattr(self._root, name)
-    
+
     def __setattr__(self, name, value):
-        if name in ["_root", "_interval", "_loop"]:
+        if name in [
+            "_root",
+            "_interval",
+            "_loop",
+            "_selector",
+            "_closing",
+            "_step_pending",
+            "_deadlines",
+            "_timer",
+        ]:
             super().__setattr__(name, value)
         else:
             setattr(self._root, name, value)
-    
+
     def __del__(self):
-        self._loop.run_until_complete(self._loop.shutdown_asyncgens())
-        self._loop.close()
+        loop = self.__dict__.get("_loop")
+        if loop is not None and not loop.is_closed():
+            loop.close()
 
 # Use AsyncTk instead of ThemedTk in your application.
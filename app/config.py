@@ -0,0 +1,37 @@
+import json
+import os
+
+DEFAULT_CONFIG_FILE = "configs/nodes_config.json"
+# Next to the config files, so the volume mounted for them keeps the history too
+DEFAULT_HISTORY_DIR = "configs/history"
+MAX_CONCURRENT_CONNECTIONS = 50
+DEFAULT_SSH_PORT = 22
+
+
+def node_key(node_info):
+    # Identifies a node's connection, sampler, caches and history. The port
+    # is only added when it is not the default, so existing keys stay the same
+    key = f"{node_info['host']}_{node_info['user']}"
+    port = node_info.get("port", DEFAULT_SSH_PORT)
+    if port != DEFAULT_SSH_PORT:
+        key = f"{key}_{port}"
+    return key
+
+
+def load_nodes(config_file):
+    try:
+        if not os.path.exists(config_file):
+            return []
+
+        with open(config_file, "r") as f:
+            nodes = json.load(f)
+            if not nodes:
+                return []
+            return nodes
+    except (FileNotFoundError, json.JSONDecodeError):
+        return []
+
+
+def save_nodes(config_file, nodes):
+    with open(config_file, "w") as f:
+        json.dump(nodes, f, indent=4)
@@ -0,0 +1,235 @@
+import asyncio
+from metrics import CPU_STATES
+from instrumentation import BUCKETS, instrumentation
+
+PREFIX = "cluster_monitor_"
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+DEFAULT_PORT = 9812
+REFRESH_INTERVAL = 1
+MEGABYTE = 1024**2
+
+FAMILIES = [
+    ("cpu_load_percent", "Share of CPU time not spent idle"),
+    ("cpu_mode_percent", "Share of CPU time per mode"),
+    ("cpu_core_load_percent", "Share of CPU time not spent idle per core"),
+    ("load_average", "System load average"),
+    ("memory_bytes", "Memory by state"),
+    ("memory_used_percent", "Used share of memory"),
+    ("swap_bytes", "Swap by state"),
+    ("swap_used_percent", "Used share of swap"),
+    ("filesystem_size_bytes", "Filesystem size"),
+    ("filesystem_used_bytes", "Used filesystem space"),
+    ("filesystem_available_bytes", "Available filesystem space"),
+    ("filesystem_used_percent", "Used share of filesystem space"),
+    ("network_receive_bytes_per_second", "Bytes received per second"),
+    ("network_transmit_bytes_per_second", "Bytes sent per second"),
+    ("disk_reads_per_second", "Completed reads per second"),
+    ("disk_writes_per_second", "Completed writes per second"),
+    ("disk_read_bytes_per_second", "Bytes read per second"),
+    ("disk_written_bytes_per_second", "Bytes written per second"),
+    ("disk_io_ops_per_second", "Completed reads and writes per second"),
+    ("last_sample_timestamp_seconds", "Time of the latest sample per metric"),
+]
+
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_sample(family, labels, value):
+    label_text = ",".join(f'{key}="{escape_label(item)}"' for key, item in labels.items())
+    return f"{PREFIX}{family}{{{label_text}}} {float(value)!r}"
+
+
+def render_cpu(node, cpu_metrics):
+    yield "cpu_load_percent", {"node": node}, cpu_metrics["cpu_load"]
+    for state in CPU_STATES:
+        yield "cpu_mode_percent", {"node": node, "mode": state}, cpu_metrics[f"cpu_{state}"]
+    for core, load in enumerate(cpu_metrics.get("per_core_load", [])):
+        yield "cpu_core_load_percent", {"node": node, "core": core}, load
+    for period in ["1min", "5min", "15min"]:
+        yield "load_average", {"node": node, "period": period}, cpu_metrics[f"load_avg_{period}"]
+
+
+def render_memory(node, memory_metrics, swap_metrics):
+    for state in ["total", "used", "free", "shared", "buff_cache", "available"]:
+        yield "memory_bytes", {"node": node, "state": state}, memory_metrics[state] * MEGABYTE
+    yield "memory_used_percent", {"node": node}, memory_metrics["used_percent"]
+    for state in ["total", "used", "free"]:
+        yield "swap_bytes", {"node": node, "state": state}, swap_metrics[state] * MEGABYTE
+    yield "swap_used_percent", {"node": node}, swap_metrics["used_percent"]
+
+
+def render_disk(node, volumes):
+    for volume in volumes:
+        labels = {
+            "node": node,
+            "filesystem": volume.filesystem,
+            "mountpoint": volume.mounted_on,
+        }
+        yield "filesystem_size_bytes", labels, volume.size
+        yield "filesystem_used_bytes", labels, volume.used
+        yield "filesystem_available_bytes", labels, volume.available
+        yield "filesystem_used_percent", labels, volume.use_percent
+
+
+def render_network(node, network_metrics):
+    for interface, rates in network_metrics.items():
+        labels = {"node": node, "interface": interface}
+        yield "network_receive_bytes_per_second", labels, rates.bytes_in
+        yield "network_transmit_bytes_per_second", labels, rates.bytes_out
+
+
+def render_diskio(node, diskio_metrics):
+    for device, rates in diskio_metrics.items():
+        labels = {"node": node, "device": device}
+        yield "disk_reads_per_second", labels, rates.reads
+        yield "disk_writes_per_second", labels, rates.writes
+        yield "disk_read_bytes_per_second", labels, rates.read_bytes
+        yield "disk_written_bytes_per_second", labels, rates.write_bytes
+        yield "disk_io_ops_per_second", labels, rates.io_ops
+
+
+def render_instrumentation():
+    # Cluster-wide totals only, per-node histograms would multiply the series
+    # count by the number of nodes
+    output = []
+    if instrumentation.totals:
+        family = f"{PREFIX}internal_duration_seconds"
+        output.append(f"# HELP {family} Time spent per collector and stage")
+        output.append(f"# TYPE {family} histogram")
+        for (collector, stage), histogram in sorted(instrumentation.totals.items()):
+            labels = {"collector": collector, "stage": stage}
+            cumulative = 0
+            for bound, count in zip(BUCKETS, histogram.counts):
+                cumulative += count
+                output.append(
+                    format_sample("internal_duration_seconds_bucket", {**labels, "le": bound}, cumulative)
+                )
+            output.append(
+                format_sample("internal_duration_seconds_bucket", {**labels, "le": "+Inf"}, histogram.count)
+            )
+            output.append(format_sample("internal_duration_seconds_sum", labels, histogram.total))
+            output.append(format_sample("internal_duration_seconds_count", labels, histogram.count))
+
+    if instrumentation.error_totals:
+        family = f"{PREFIX}internal_errors_total"
+        output.append(f"# HELP {family} Failures per collector and stage")
+        output.append(f"# TYPE {family} counter")
+        for (collector, stage), count in sorted(instrumentation.error_totals.items()):
+            output.append(
+                format_sample("internal_errors_total", {"collector": collector, "stage": stage}, count)
+            )
+    return output
+
+
+RENDERERS = {
+    "cpu": render_cpu,
+    "memory": render_memory,
+    "disk": render_disk,
+    "network": render_network,
+    "diskio": render_diskio,
+}
+
+
+# Samples are turned into exposition lines as they arrive; once per tick the
+# lines of all nodes are joined into one body that replaces the previous one,
+# so a scrape only writes out bytes that already exist
+class PrometheusExporter:
+    def __init__(self, host="127.0.0.1", port=DEFAULT_PORT, refresh_interval=REFRESH_INTERVAL):
+        self.host = host
+        self.port = port
+        self.refresh_interval = refresh_interval
+        self.samples = {}
+        self.changed = False
+        self.instrumentation_version = instrumentation.version
+        self.snapshot = self.render()
+        self.server = None
+        self.refresh_task = None
+
+    def record(self, node_info, metric, result):
+        key = (node_info["name"], metric)
+        if result is None:
+            self.changed = self.samples.pop(key, None) is not None or self.changed
+            return
+
+        lines = {}
+        for family, labels, value in RENDERERS[metric](node_info["name"], *result[1:]):
+            lines.setdefault(family, []).append(format_sample(family, labels, value))
+        lines.setdefault("last_sample_timestamp_seconds", []).append(
+            format_sample(
+                "last_sample_timestamp_seconds",
+                {"node": node_info["name"], "metric": metric},
+                result[0],
+            )
+        )
+        self.samples[key] = lines
+        self.changed = True
+
+    def remove(self, node_info):
+        for metric in RENDERERS:
+            if self.samples.pop((node_info["name"], metric), None) is not None:
+                self.changed = True
+
+    def render(self):
+        output = []
+        for family, help_text in FAMILIES:
+            lines = [
+                line
+                for node_lines in self.samples.values()
+                for line in node_lines.get(family, [])
+            ]
+            if lines:
+                output.append(f"# HELP {PREFIX}{family} {help_text}")
+                output.append(f"# TYPE {PREFIX}{family} gauge")
+                output.extend(lines)
+        output.extend(render_instrumentation())
+        output.append("")
+        return "\n".join(output).encode()
+
+    async def refresh(self):
+        while True:
+            if self.changed or self.instrumentation_version != instrumentation.version:
+                self.changed = False
+                self.instrumentation_version = instrumentation.version
+                self.snapshot = self.render()
+            await asyncio.sleep(self.refresh_interval)
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle_request, self.host, self.port)
+        self.refresh_task = asyncio.ensure_future(self.refresh())
+        print(f"Serving Prometheus metrics on http://{self.host}:{self.port}/metrics")
+
+    async def stop(self):
+        if self.refresh_task:
+            self.refresh_task.cancel()
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+
+    async def handle_request(self, reader, writer):
+        try:
+            request_line = await reader.readline()
+            # Headers are not needed, only read past them
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+
+            parts = request_line.decode("latin-1").split()
+            if len(parts) >= 2 and parts[0] in ("GET", "HEAD") and parts[1].split("?")[0] == "/metrics":
+                status, body = "200 OK", self.snapshot
+            else:
+                status, body = "404 Not Found", b"Not Found\n"
+
+            writer.write(
+                f"HTTP/1.1 {status}\r\n"
+                f"Content-Type: {CONTENT_TYPE}\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                "Connection: close\r\n\r\n".encode()
+            )
+            if parts and parts[0] != "HEAD":
+                writer.write(body)
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError) as e:
+            print(f"Error serving metrics request: {e}")
+        finally:
+            writer.close()
@@ -0,0 +1,220 @@
+import asyncio
+import contextlib
+import json
+import sys
+import time
+import numpy as np
+from metrics import (
+    get_ssh_connection,
+    get_sampling_policy,
+    subscribe_metrics,
+    unsubscribe_metrics,
+    watch_reconnect,
+    close_all_connections,
+)
+from config import MAX_CONCURRENT_CONNECTIONS, load_nodes
+from instrumentation import instrumentation
+
+REPORT_INTERVAL = 10
+MAX_FAILED_ATTEMPTS = 20
+
+
+def to_json(value):
+    if hasattr(value, "_asdict"):
+        return {key: to_json(item) for key, item in value._asdict().items()}
+    if isinstance(value, dict):
+        return {key: to_json(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_json(item) for item in value]
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+# One JSON object per sample and line, written to stdout or appended to a file
+class JSONLSink:
+    def __init__(self, stream, owns_stream=False):
+        self.stream = stream
+        # Only a file opened for the sink is closed with it, never stdout
+        self.owns_stream = owns_stream
+        self.records = 0
+        self.bytes = 0
+
+    def write(self, node_info, metric, result):
+        if metric == "memory":
+            timestamp, memory_metrics, swap_metrics = result
+            values = {"memory": memory_metrics, "swap": swap_metrics}
+        else:
+            timestamp, values = result
+
+        line = json.dumps(
+            {
+                "node": node_info["name"],
+                "metric": metric,
+                "timestamp": timestamp,
+                "values": to_json(values),
+            },
+            separators=(",", ":"),
+        )
+        self.stream.write(line + "\n")
+        self.records += 1
+        self.bytes += len(line) + 1
+
+    def flush(self):
+        self.stream.flush()
+
+    def close(self):
+        self.flush()
+        if self.owns_stream:
+            self.stream.close()
+
+
+class HeadlessCollector:
+    def __init__(
+        self,
+        nodes,
+        sink,
+        max_concurrency=MAX_CONCURRENT_CONNECTIONS,
+        report_interval=REPORT_INTERVAL,
+        exporter=None,
+    ):
+        self.nodes = nodes
+        self.sink = sink
+        self.exporter = exporter
+        self.max_concurrency = max_concurrency
+        self.report_interval = report_interval
+        self.callbacks = {}
+        self.failed_attempts = {}
+        self.samples = 0
+        self.failures = 0
+        self.reporting_nodes = set()
+
+    async def run(self):
+        if self.exporter:
+            await self.exporter.start()
+        report_task = asyncio.ensure_future(self.report_throughput())
+        try:
+            await self.connect_nodes()
+            await report_task
+        finally:
+            report_task.cancel()
+            for name in list(self.callbacks):
+                self.stop_node(name)
+            if self.exporter:
+                await self.exporter.stop()
+            await close_all_connections()
+            self.sink.close()
+
+    async def connect_nodes(self):
+        start_time = time.time()
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def connect_node(node_info):
+            async with semaphore:
+                ssh_client, connected = await get_ssh_connection(node_info)
+            if connected:
+                self.start_node(node_info)
+            else:
+                watch_reconnect(node_info, self.start_node)
+            return connected
+
+        results = await asyncio.gather(
+            *(connect_node(node_info) for node_info in self.nodes)
+        )
+        print(
+            f"Connected to {sum(results)}/{len(self.nodes)} nodes "
+            f"in {time.time() - start_time:.1f} seconds"
+        )
+
+    def start_node(self, node_info):
+        def on_metrics(metric, result):
+            self.on_metrics(node_info, metric, result)
+
+        self.callbacks[node_info["name"]] = (node_info, on_metrics)
+        self.failed_attempts[node_info["name"]] = 0
+        subscribe_metrics(node_info, on_metrics)
+
+    def stop_node(self, name):
+        node_info, on_metrics = self.callbacks.pop(name)
+        unsubscribe_metrics(node_info, on_metrics)
+        if self.exporter:
+            self.exporter.remove(node_info)
+
+    def on_metrics(self, node_info, metric, result):
+        name = node_info["name"]
+        if self.exporter:
+            self.exporter.record(node_info, metric, result)
+        if result is None:
+            self.failures += 1
+            if metric == "cpu":
+                self.failed_attempts[name] += 1
+                # Same rule as a node card turning into a failed card
+                if self.failed_attempts[name] >= MAX_FAILED_ATTEMPTS:
+                    print(f"Node {name} failed, waiting for it to reconnect")
+                    self.stop_node(name)
+                    watch_reconnect(node_info, self.start_node)
+            return
+
+        if metric == "cpu":
+            self.failed_attempts[name] = 0
+        self.samples += 1
+        self.reporting_nodes.add(name)
+        self.sink.write(node_info, metric, result)
+
+    async def report_throughput(self):
+        last_time = time.monotonic()
+        last_samples = last_failures = last_bytes = last_deadlines = 0
+        while True:
+            await asyncio.sleep(self.report_interval)
+            self.sink.flush()
+
+            now = time.monotonic()
+            elapsed = now - last_time
+            deadlines = instrumentation.count_errors("deadline")
+            policy = get_sampling_policy()
+            print(
+                f"{len(self.callbacks)}/{len(self.nodes)} nodes collecting, "
+                f"{len(self.reporting_nodes)} reported, "
+                f"{(self.samples - last_samples) / elapsed:.1f} samples/s, "
+                f"{(self.failures - last_failures) / elapsed:.1f} failed/s, "
+                f"{deadlines - last_deadlines} missed deadlines, "
+                f"{policy.planned:.0f}/{policy.budget:.0f} samples/s planned, "
+                f"{(self.sink.bytes - last_bytes) / elapsed / 1024:.1f} KB/s written"
+            )
+            last_time = now
+            last_samples = self.samples
+            last_failures = self.failures
+            last_bytes = self.sink.bytes
+            last_deadlines = deadlines
+            self.reporting_nodes.clear()
+
+
+def run_headless(
+    config_file,
+    output="-",
+    max_concurrency=MAX_CONCURRENT_CONNECTIONS,
+    report_interval=REPORT_INTERVAL,
+    exporter=None,
+):
+    nodes = load_nodes(config_file)
+    if not nodes:
+        print(f"No nodes found in {config_file}", file=sys.stderr)
+        return
+
+    if output == "-":
+        sink = JSONLSink(sys.stdout)
+    else:
+        sink = JSONLSink(open(output, "a"), owns_stream=True)
+
+    collector = HeadlessCollector(
+        nodes, sink, max_concurrency, report_interval, exporter
+    )
+    # Status messages and throughput reports go to stderr wherever the
+    # samples go, stdout may be the sample stream
+    with contextlib.redirect_stdout(sys.stderr):
+        try:
+            asyncio.run(collector.run())
+        except KeyboardInterrupt:
+            pass
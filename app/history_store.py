@@ -0,0 +1,314 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from urllib.parse import quote, unquote
+import numpy as np
+from config import node_key
+from instrumentation import instrumentation
+
+# A segment holds one series for at most an hour; a new one is started when
+# the hour is over or the rows run out, whichever comes first
+SEGMENT_SECONDS = 3600
+SEGMENT_ROWS = 8192
+# Headers take whole pages, as many as the column names need
+HEADER_SIZE = 4096
+MAGIC = b"CMSEG01\n"
+SEGMENT_SUFFIX = ".seg"
+# Samples are buffered per series and written in batches
+FLUSH_INTERVAL = 5
+FLUSH_ROWS = 256
+RETENTION_DAYS = 7
+
+
+def segment_name(start_time):
+    return f"{round(start_time * 1000):015d}{SEGMENT_SUFFIX}"
+
+
+# One segment file: a header with the committed row count, its own size and
+# the column names, then a float64 time column and one float32 column per
+# value, each preallocated to `rows` entries. Columns are contiguous on disk,
+# so a time range of any of them is a slice of a memory map. The row count is
+# written after the rows, a reader never sees a row that is only half written.
+class Segment:
+    def __init__(self, path, start, columns, rows, count=0, header_size=HEADER_SIZE):
+        self.path = path
+        self.start = start
+        self.columns = list(columns)
+        self.rows = rows
+        self.count = count
+        self.header_size = header_size
+
+    @classmethod
+    def create(cls, path, start, columns, rows=SEGMENT_ROWS):
+        header = json.dumps({"start": start, "columns": list(columns), "rows": rows}).encode()
+        header_size = -(-(len(MAGIC) + 16 + len(header)) // HEADER_SIZE) * HEADER_SIZE
+        with open(path, "wb") as f:
+            f.write(MAGIC + np.int64(0).tobytes() + np.int64(header_size).tobytes() + header)
+            # Unwritten rows stay holes in a sparse file
+            f.truncate(header_size + rows * (8 + 4 * len(columns)))
+        return cls(path, start, columns, rows, header_size=header_size)
+
+    @classmethod
+    def open(cls, path):
+        with open(path, "rb") as f:
+            prefix = f.read(len(MAGIC) + 16)
+            if not prefix.startswith(MAGIC):
+                raise ValueError(f"Not a history segment: {path}")
+            header_size = int(np.frombuffer(prefix, np.int64, 1, len(MAGIC) + 8)[0])
+            header = f.read(header_size - len(prefix))
+        count = int(np.frombuffer(prefix, np.int64, 1, len(MAGIC))[0])
+        info = json.loads(header.rstrip(b"\0"))
+        return cls(path, info["start"], info["columns"], info["rows"], count, header_size)
+
+    @property
+    def end(self):
+        return self.start - self.start % SEGMENT_SECONDS + SEGMENT_SECONDS
+
+    def append(self, times, values):
+        n = min(len(times), self.rows - self.count)
+        fd = os.open(self.path, os.O_WRONLY)
+        try:
+            os.pwrite(fd, times[:n].tobytes(), self.header_size + 8 * self.count)
+            column_start = self.header_size + 8 * self.rows
+            for index in range(len(self.columns)):
+                os.pwrite(
+                    fd,
+                    values[:n, index].tobytes(),
+                    column_start + 4 * (index * self.rows + self.count),
+                )
+            self.count += n
+            os.pwrite(fd, np.int64(self.count).tobytes(), len(MAGIC))
+        finally:
+            os.close(fd)
+        return n
+
+    def read(self, start_time=None, end_time=None):
+        if not self.count:
+            return np.empty(0), np.empty((0, len(self.columns)), np.float32)
+        times = np.memmap(self.path, np.float64, "r", self.header_size, (self.count,))
+        values = np.memmap(
+            self.path,
+            np.float32,
+            "r",
+            self.header_size + 8 * self.rows,
+            (len(self.columns), self.rows),
+        )
+        begin = 0 if start_time is None else int(np.searchsorted(times, start_time))
+        end = self.count if end_time is None else int(np.searchsorted(times, end_time, "right"))
+        return times[begin:end], values[:, begin:end].T
+
+
+# The segments of one series in a directory of their own, named after the
+# time of their first row. Rows are appended on the event loop and written
+# from a worker thread; one lock guards the buffered rows, the other the files
+class SeriesStore:
+    def __init__(self, path, retention):
+        self.path = path
+        self.retention = retention
+        self.columns = None
+        self.active = None
+        self.pending = []
+        self.pending_lock = threading.Lock()
+        self.write_lock = threading.Lock()
+
+    def segment_paths(self):
+        try:
+            names = os.listdir(self.path)
+        except FileNotFoundError:
+            return []
+        return [
+            os.path.join(self.path, name) for name in sorted(names) if name.endswith(SEGMENT_SUFFIX)
+        ]
+
+    def append(self, timestamp, values, columns):
+        if self.columns != list(columns):
+            with self.write_lock:
+                self.write()
+                self.columns = list(columns)
+                self.active = self.resume()
+        with self.pending_lock:
+            self.pending.append((timestamp, values))
+            full = len(self.pending) >= FLUSH_ROWS
+        if full:
+            self.flush()
+
+    def resume(self):
+        # Carries on with the newest segment after a restart if it still fits
+        paths = self.segment_paths()
+        if paths:
+            try:
+                segment = Segment.open(paths[-1])
+                if segment.columns == self.columns:
+                    return segment
+            except (OSError, ValueError) as e:
+                print(f"Skipping history segment {paths[-1]}: {e}")
+        return None
+
+    def flush(self):
+        with self.write_lock:
+            self.write()
+
+    def write(self):
+        with self.pending_lock:
+            pending, self.pending = self.pending, []
+        if not pending:
+            return
+        times = np.array([timestamp for timestamp, _ in pending], np.float64)
+        values = np.array([values for _, values in pending], np.float32).reshape(len(times), -1)
+
+        os.makedirs(self.path, exist_ok=True)
+        while len(times):
+            segment = self.active
+            if segment is None or segment.count >= segment.rows or times[0] >= segment.end:
+                segment = self.active = Segment.create(
+                    os.path.join(self.path, segment_name(times[0])), times[0], self.columns
+                )
+                self.prune(times[0] - self.retention)
+            # Rows past the end of the segment's hour go to the next one
+            fits = int(np.searchsorted(times, segment.end))
+            written = segment.append(times[:fits], values[:fits])
+            times = times[written:]
+            values = values[written:]
+
+    def prune(self, before):
+        paths = self.segment_paths()
+        # A segment ends where the next one starts, the newest is never pruned
+        for path, next_path in zip(paths, paths[1:]):
+            if self.get_start(next_path) > before:
+                break
+            os.remove(path)
+
+    def get_start(self, path):
+        return int(os.path.basename(path)[: -len(SEGMENT_SUFFIX)]) / 1000
+
+    def read(self, start_time=None, end_time=None):
+        # (columns, times, values) per segment, the arrays are memory map slices
+        paths = self.segment_paths()
+        ranges = []
+        for index, path in enumerate(paths):
+            if end_time is not None and self.get_start(path) > end_time:
+                break
+            if (
+                start_time is not None
+                and index + 1 < len(paths)
+                and self.get_start(paths[index + 1]) <= start_time
+            ):
+                continue
+            try:
+                segment = Segment.open(path)
+            except (OSError, ValueError) as e:
+                print(f"Skipping history segment {path}: {e}")
+                continue
+            times, values = segment.read(start_time, end_time)
+            if len(times):
+                ranges.append((segment.columns, times, values))
+        return ranges
+
+
+# The series of one node, e.g. "cpu" or "network/eth0"
+class NodeStore:
+    def __init__(self, name, path, retention):
+        self.name = name
+        self.path = path
+        self.retention = retention
+        self.series = {}
+
+    def get_series(self, name):
+        if name not in self.series:
+            path = os.path.join(self.path, *(quote(part, safe="") for part in name.split("/", 1)))
+            self.series[name] = SeriesStore(path, self.retention)
+        return self.series[name]
+
+    def append(self, name, timestamp, values, columns):
+        self.get_series(name).append(timestamp, values, columns)
+
+    def read(self, name, start_time=None, end_time=None):
+        series = self.get_series(name)
+        self.flush_series(series)
+        return series.read(start_time, end_time)
+
+    def list_series(self):
+        names = []
+        try:
+            entries = sorted(os.scandir(self.path), key=lambda entry: entry.name)
+        except FileNotFoundError:
+            return names
+        for entry in entries:
+            if not entry.is_dir():
+                continue
+            if any(name.endswith(SEGMENT_SUFFIX) for name in os.listdir(entry.path)):
+                names.append(unquote(entry.name))
+            else:
+                names.extend(
+                    f"{unquote(entry.name)}/{unquote(child)}" for child in sorted(os.listdir(entry.path))
+                )
+        return names
+
+    def flush_series(self, series):
+        # A series that cannot be written drops its batch, the others go on
+        try:
+            series.flush()
+        except Exception as e:
+            print(f"Error writing history to {series.path}: {e}")
+            return False
+        return True
+
+    def flush(self):
+        # Whether every series was written
+        written = [self.flush_series(series) for series in list(self.series.values())]
+        return all(written)
+
+
+# Samples of every node on disk, one directory per node. Appends only touch
+# memory, the files are written every FLUSH_INTERVAL seconds on a worker
+# thread, so the UI never waits for the disk, and on close.
+class HistoryStore:
+    def __init__(self, path, retention_days=RETENTION_DAYS):
+        self.path = path
+        self.retention = retention_days * 86400
+        self.nodes = {}
+        self.flush_task = None
+
+    def get_node(self, node_info):
+        node_id = node_key(node_info)
+        if node_id not in self.nodes:
+            self.nodes[node_id] = NodeStore(
+                node_info["name"], os.path.join(self.path, quote(node_id, safe="")), self.retention
+            )
+        return self.nodes[node_id]
+
+    def start(self):
+        self.flush_task = asyncio.ensure_future(self.flush_periodically())
+
+    async def flush_periodically(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(FLUSH_INTERVAL)
+            self.record(await loop.run_in_executor(None, self.write))
+
+    def write(self):
+        # (node name, seconds taken or None if a series failed) per node
+        results = []
+        for node in list(self.nodes.values()):
+            start = time.perf_counter()
+            written = node.flush()
+            results.append((node.name, time.perf_counter() - start if written else None))
+        return results
+
+    def record(self, results):
+        # On the event loop, like every other instrumentation update
+        for name, elapsed in results:
+            if elapsed is None:
+                instrumentation.record_error(name, "history", "write")
+            else:
+                instrumentation.record(name, "history", "write", elapsed)
+
+    def flush(self):
+        self.record(self.write())
+
+    def close(self):
+        if self.flush_task:
+            self.flush_task.cancel()
+        self.flush()
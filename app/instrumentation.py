@@ -0,0 +1,137 @@
+import bisect
+import json
+import time
+
+# Upper bounds in seconds, the last bucket takes everything slower
+BUCKETS = (
+    0.0001, 0.00025, 0.0005,
+    0.001, 0.0025, 0.005,
+    0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5,
+    1, 2.5, 5,
+    10, 25, 50, 100,
+)
+
+
+class LatencyHistogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    # Interpolates inside the bucket the percentile falls into
+    def percentile(self, percent):
+        if not self.count:
+            return 0.0
+        rank = self.count * percent / 100
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = BUCKETS[index - 1] if index > 0 else 0.0
+                upper = BUCKETS[index] if index < len(BUCKETS) else self.max
+                value = lower + (upper - lower) * (rank - seen) / count
+                return min(value, self.max)
+            seen += count
+        return self.max
+
+
+# Durations and errors per (node, collector, stage). Every record costs two
+# dictionary lookups and a bisect, cheap enough to stay on all the time.
+# The cluster-wide totals per (collector, stage) are kept alongside so the
+# Prometheus endpoint does not have to merge thousands of node histograms.
+class Instrumentation:
+    def __init__(self):
+        self.histograms = {}
+        self.errors = {}
+        self.totals = {}
+        self.error_totals = {}
+        self.version = 0
+        self.started = time.time()
+
+    def record(self, node, collector, stage, seconds):
+        key = (node, collector, stage)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = LatencyHistogram()
+        histogram.record(seconds)
+
+        total = self.totals.get((collector, stage))
+        if total is None:
+            total = self.totals[(collector, stage)] = LatencyHistogram()
+        total.record(seconds)
+        self.version += 1
+
+    def record_error(self, node, collector, stage):
+        key = (node, collector, stage)
+        self.errors[key] = self.errors.get(key, 0) + 1
+        self.error_totals[(collector, stage)] = self.error_totals.get((collector, stage), 0) + 1
+        self.version += 1
+
+    def count_errors(self, stage):
+        return sum(count for (_, error_stage), count in self.error_totals.items() if error_stage == stage)
+
+    def remove_node(self, node):
+        for key in [key for key in self.histograms if key[0] == node]:
+            del self.histograms[key]
+        for key in [key for key in self.errors if key[0] == node]:
+            del self.errors[key]
+
+    def summarize(self, node, collector, stage, histogram, errors):
+        histogram = histogram or LatencyHistogram()
+        return {
+            "node": node,
+            "collector": collector,
+            "stage": stage,
+            "count": histogram.count,
+            "errors": errors,
+            "mean": histogram.mean(),
+            "p50": histogram.percentile(50),
+            "p95": histogram.percentile(95),
+            "p99": histogram.percentile(99),
+            "max": histogram.max,
+        }
+
+    def rows(self, per_node=True):
+        if per_node:
+            histograms, errors = self.histograms, self.errors
+        else:
+            histograms = {(None,) + key: value for key, value in self.totals.items()}
+            errors = {(None,) + key: value for key, value in self.error_totals.items()}
+
+        rows = []
+        for key in set(histograms) | set(errors):
+            rows.append(self.summarize(*key, histograms.get(key), errors.get(key, 0)))
+        return rows
+
+    def export(self, path):
+        rows = self.rows()
+        for row in rows:
+            histogram = self.histograms.get((row["node"], row["collector"], row["stage"]))
+            row["total"] = histogram.total if histogram else 0.0
+            row["bucket_counts"] = histogram.counts if histogram else []
+
+        with open(path, "w") as f:
+            json.dump(
+                {
+                    "started": self.started,
+                    "exported": time.time(),
+                    "buckets": BUCKETS,
+                    "rows": rows,
+                },
+                f,
+                indent=2,
+            )
+
+
+instrumentation = Instrumentation()
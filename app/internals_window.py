@@ -0,0 +1,111 @@
+import asyncio
+import tkinter as tk
+from tkinter import ttk, filedialog
+from instrumentation import instrumentation
+
+REFRESH_INTERVAL = 1
+MAX_ROWS = 200
+COLUMNS = [
+    ("node", "Node", 140),
+    ("collector", "Collector", 180),
+    ("stage", "Stage", 70),
+    ("count", "Count", 70),
+    ("errors", "Errors", 60),
+    ("mean", "Mean ms", 70),
+    ("p50", "p50 ms", 70),
+    ("p95", "p95 ms", 70),
+    ("p99", "p99 ms", 70),
+    ("max", "Max ms", 70),
+]
+SORT_KEYS = ["p95", "p99", "max", "mean", "errors", "count"]
+
+
+# Live view of where the time goes: connecting, the remote command, parsing
+# and drawing, per node and collector, slowest first
+class InternalsWindow(tk.Toplevel):
+    def __init__(self, parent):
+        super().__init__(parent)
+        self.title("Internals")
+        self.geometry("960x480")
+
+        controls = tk.Frame(self)
+        controls.pack(fill=tk.X)
+
+        self.per_node_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(
+            controls,
+            text="Per node",
+            variable=self.per_node_var,
+            command=self.refresh,
+        ).pack(side=tk.LEFT)
+
+        tk.Label(controls, text="Sort by").pack(side=tk.LEFT)
+        self.sort_var = tk.StringVar(value=SORT_KEYS[0])
+        sort_box = ttk.Combobox(
+            controls, textvariable=self.sort_var, values=SORT_KEYS, state="readonly", width=8
+        )
+        sort_box.pack(side=tk.LEFT)
+        sort_box.bind("<<ComboboxSelected>>", lambda event: self.refresh())
+
+        tk.Button(controls, text="Export", command=self.export).pack(side=tk.RIGHT)
+        self.status_label = tk.Label(controls, text="")
+        self.status_label.pack(side=tk.RIGHT)
+
+        self.tree = ttk.Treeview(
+            self, columns=[key for key, _, _ in COLUMNS], show="headings"
+        )
+        for key, heading, width in COLUMNS:
+            anchor = "w" if key in ("node", "collector", "stage") else "e"
+            self.tree.heading(key, text=heading)
+            self.tree.column(key, width=width, anchor=anchor)
+        scrollbar = ttk.Scrollbar(self, orient="vertical", command=self.tree.yview)
+        self.tree.configure(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.tree.pack(fill=tk.BOTH, expand=True)
+
+        self.refresh_task = asyncio.ensure_future(self.refresh_periodically())
+
+    async def refresh_periodically(self):
+        while True:
+            if self.winfo_viewable():
+                self.refresh()
+            await asyncio.sleep(REFRESH_INTERVAL)
+
+    def refresh(self):
+        rows = instrumentation.rows(self.per_node_var.get())
+        sort_key = self.sort_var.get()
+        rows.sort(key=lambda row: row[sort_key], reverse=True)
+
+        self.status_label.config(
+            text=f"Showing {min(len(rows), MAX_ROWS)} of {len(rows)} rows"
+        )
+
+        # Rows keep their item ids, only the values of existing rows change
+        items = self.tree.get_children()
+        for index, row in enumerate(rows[:MAX_ROWS]):
+            values = [
+                row["node"] if row["node"] is not None else "All nodes",
+                row["collector"],
+                row["stage"],
+                row["count"],
+                row["errors"],
+            ] + [f"{row[key] * 1000:.2f}" for key in ("mean", "p50", "p95", "p99", "max")]
+            if index < len(items):
+                self.tree.item(items[index], values=values)
+            else:
+                self.tree.insert("", tk.END, values=values)
+        if len(items) > len(rows[:MAX_ROWS]):
+            self.tree.delete(*items[len(rows[:MAX_ROWS]):])
+
+    def export(self):
+        file_path = filedialog.asksaveasfilename(
+            parent=self,
+            defaultextension=".json",
+            filetypes=[("JSON files", "*.json"), ("All files", "*.*")],
+        )
+        if file_path:
+            instrumentation.export(file_path)
+
+    def destroy(self):
+        self.refresh_task.cancel()
+        super().destroy()
@@ -1,8 +1,92 @@
-import asyncio
-from app import App
+import argparse
+from config import DEFAULT_CONFIG_FILE, DEFAULT_HISTORY_DIR, MAX_CONCURRENT_CONNECTIONS
+from history_store import HistoryStore, RETENTION_DAYS
+from sampling import DEFAULT_SAMPLE_BUDGET
 
 def main():
-    app = App()
+    parser = argparse.ArgumentParser(description="Cluster Monitor")
+    parser.add_argument(
+        "--headless",
+        action="store_true",
+        help="collect metrics without the GUI and write them as JSON lines",
+    )
+    parser.add_argument(
+        "--config", default=DEFAULT_CONFIG_FILE, help="node config file (headless)"
+    )
+    parser.add_argument(
+        "--output", default="-", help="JSONL file to append to, - for stdout (headless)"
+    )
+    parser.add_argument(
+        "--max-concurrency",
+        type=int,
+        default=MAX_CONCURRENT_CONNECTIONS,
+        help="connections opened at once during startup",
+    )
+    parser.add_argument(
+        "--prometheus-port",
+        type=int,
+        help="serve the latest samples in Prometheus format on this port",
+    )
+    parser.add_argument(
+        "--prometheus-host",
+        default="127.0.0.1",
+        help="address the Prometheus endpoint listens on",
+    )
+    parser.add_argument(
+        "--report-interval",
+        type=float,
+        default=10,
+        help="seconds between throughput reports on stderr (headless)",
+    )
+    parser.add_argument(
+        "--sample-budget",
+        type=float,
+        default=DEFAULT_SAMPLE_BUDGET,
+        help="samples per second shared out between all nodes",
+    )
+    parser.add_argument(
+        "--history-dir",
+        default=DEFAULT_HISTORY_DIR,
+        help="directory the chart history is kept in, empty to keep it in memory only (GUI)",
+    )
+    parser.add_argument(
+        "--history-days",
+        type=float,
+        default=RETENTION_DAYS,
+        help="days of chart history to keep on disk (GUI)",
+    )
+    args = parser.parse_args()
+
+    from metrics import set_sample_budget
+
+    set_sample_budget(args.sample_budget)
+
+    exporter = None
+    if args.prometheus_port:
+        from exporter import PrometheusExporter
+
+        exporter = PrometheusExporter(args.prometheus_host, args.prometheus_port)
+
+    if args.headless:
+        # Imported here so headless mode never loads Tk or matplotlib
+        from headless import run_headless
+
+        run_headless(
+            args.config,
+            args.output,
+            args.max_concurrency,
+            args.report_interval,
+            exporter,
+        )
+        return
+
+    from app import App
+
+    history_store = None
+    if args.history_dir:
+        history_store = HistoryStore(args.history_dir, args.history_days)
+
+    app = App(exporter, history_store, args.max_concurrency)
     app.mainloop()
 
 if __name__ == "__main__":
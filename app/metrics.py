@@ -1,277 +1,506 @@
 import asyncssh
 import asyncio
+import random
 import re
+import time
+import zlib
+from collections import namedtuple
+import numpy as np
+from config import DEFAULT_SSH_PORT, node_key
+from instrumentation import instrumentation
+from sampling import SamplingPolicy, NodeActivity
+
+# Column order of the cpu lines in /proc/stat
+CPU_STATES = ("user", "nice", "system", "idle", "iowait", "irq", "softirq", "steal")
+
+# Remote sources that can be read together in one framed command per tick
+SECTION_MARKER = "@@section "
+BATCH_SOURCES = {
+    "clock": "cat /proc/uptime",
+    "stat": "cat /proc/stat /proc/loadavg",
+    "meminfo": "cat /proc/meminfo",
+    "df": "df -kP",
+    "netdev": "cat /proc/net/dev",
+    "diskstats": "cat /proc/diskstats",
+}
+# Typed samples carry raw numbers, rates in units per second and sizes in bytes
+InterfaceRates = namedtuple("InterfaceRates", ["bytes_in", "bytes_out"])
+DeviceRates = namedtuple(
+    "DeviceRates", ["reads", "writes", "read_bytes", "write_bytes", "io_ops"]
+)
+Volume = namedtuple(
+    "Volume",
+    ["filesystem", "size", "used", "available", "use_percent", "mounted_on"],
+)
+
+COLLECTOR_SOURCES = {
+    "cpu": ("stat",),
+    "memory": ("meminfo",),
+    "disk": ("df",),
+    "network": ("netdev",),
+    "diskio": ("diskstats",),
+}
+# df stats every mount and can block on a dead network filesystem; it runs
+# last in a batch and under a remote timeout so a hang is killed on the node
+BLOCKING_SOURCES = ("df",)
+# Seconds a command may take before it is cancelled, per collector; nodes can
+# override them with a "deadlines" entry in their config
+COMMAND_DEADLINES = {
+    "clock": 5,
+    "cpu": 3,
+    "memory": 3,
+    "disk": 10,
+    "network": 3,
+    "diskio": 3,
+    "system_info": 20,
+}
+# Seconds between attempts to measure a node's clock offset after one failed;
+# its samples carry the local time they arrived at until then
+CLOCK_RETRY_INTERVAL = 60
+
+# Parsers run for every node on every tick, so their patterns are compiled once
+VOLUME_PATTERNS = [re.compile(r"/dev/")]
+BASE_DRIVE_PATTERN = re.compile(r"^(sd[a-z]+|mmcblk[0-9]+)$")
+
+
+class DeadlineExceeded(TimeoutError):
+    def __init__(self, message, output=""):
+        super().__init__(message)
+        self.output = output
+        self.results = None
+        self.stalled = []
 
 
 class SSHConnectionManager:
     def __init__(self):
         self.ssh_connections = {}
+        self.pending_connections = {}
+        self.samplers = {}
+        self.scheduler = CollectionScheduler()
+        self.policy = SamplingPolicy()
+        self.deadlines = dict(COMMAND_DEADLINES)
+        self.cpu_times = {}
+        self.network_stats = {}
+        self.diskio_stats = {}
+        self.clock_offsets = {}
+        self.clock_retries = {}
         self.lock = asyncio.Lock()
 
     async def get_ssh_connection(self, node_info, max_retries=1, delay=1):
-        node_id = f"{node_info['host']}_{node_info['user']}"
+        node_id = node_key(node_info)
 
-        async with self.lock:
-            if node_id not in self.ssh_connections:
-                for attempt in range(max_retries):
-                    try:
-                        if node_info["use_key"]:
-                            ssh_client = await asyncssh.connect(
-                                node_info["host"],
-                                username=node_info["user"],
-                                client_keys=[node_info["key_path"]],
-                                known_hosts=None,
-                                connect_timeout=5.0
-                            )
-                        else:
-                            ssh_client = await asyncssh.connect(
-                                node_info["host"],
-                                username=node_info["user"],
-                                password=node_info["password"],
-                                known_hosts=None,
-                                connect_timeout=5.0
-                            )
-                        self.ssh_connections[node_id] = ssh_client
-                        print(
-                            f"Successfully connected to {node_info['name']} ({node_info['host']})"
+        if node_id in self.ssh_connections:
+            return self.ssh_connections[node_id], True
+
+        # Callers asking for the same node share one attempt, other nodes connect in parallel
+        task = self.pending_connections.get(node_id)
+        if task is None:
+            task = asyncio.ensure_future(
+                self.open_ssh_connection(node_id, node_info, max_retries, delay)
+            )
+            self.pending_connections[node_id] = task
+
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if task.cancelled():
+                return None, False
+            raise
+
+    async def open_ssh_connection(self, node_id, node_info, max_retries, delay):
+        try:
+            for attempt in range(max_retries):
+                start = time.perf_counter()
+                try:
+                    if node_info["use_key"]:
+                        ssh_client = await asyncssh.connect(
+                            node_info["host"],
+                            port=node_info.get("port", DEFAULT_SSH_PORT),
+                            username=node_info["user"],
+                            client_keys=[node_info["key_path"]],
+                            known_hosts=None,
+                            connect_timeout=5.0
                         )
-                        return ssh_client, True
-                    except Exception as e:
-                        print(
-                            f"Failed to connect to {node_info['name']} ({node_info['host']}): {e}"
+                    else:
+                        ssh_client = await asyncssh.connect(
+                            node_info["host"],
+                            port=node_info.get("port", DEFAULT_SSH_PORT),
+                            username=node_info["user"],
+                            password=node_info["password"],
+                            known_hosts=None,
+                            connect_timeout=5.0
                         )
-                        if attempt < max_retries - 1:
-                            print(f"Retrying in {delay} seconds...")
-                            await asyncio.sleep(delay)
-                        else:
-                            print(f"Exceeded maximum retries for {node_info['name']} ({node_info['host']}). Giving up.")
-                            return None, False
-
-        return self.ssh_connections[node_id], True
-
-    async def execute_command(self, ssh_client, command):
-        result = await ssh_client.run(command)
-        return result.stdout.strip()
-
-    def parse_top_output(self, output):
-        lines = output.split("\n")
-        cpu_metrics = {}
-        system_time = ""
-
-        load_avg_pattern = re.compile(r"load average: ([\d\.]+), ([\d\.]+), ([\d\.]+)")
-        time_pattern = re.compile(r"(\d{2}:\d{2}:\d{2})")
-
-        for line in lines:
-            time_match = time_pattern.search(line)
-            if time_match:
-                system_time = time_match.group(1)
-
-            if "load average:" in line:
-                load_match = load_avg_pattern.search(line)
-                if load_match:
-                    cpu_metrics.update(
-                        {
-                            "load_avg_1min": round(float(load_match.group(1)), 2),
-                            "load_avg_5min": round(float(load_match.group(2)), 2),
-                            "load_avg_15min": round(float(load_match.group(3)), 2),
-                        }
+                    instrumentation.record(
+                        node_info["name"], "connection", "connect", time.perf_counter() - start
                     )
+                    self.ssh_connections[node_id] = ssh_client
+                    print(
+                        f"Successfully connected to {node_info['name']} ({node_info['host']})"
+                    )
+                    await self.measure_clock_offset(node_id, node_info, ssh_client)
+                    return ssh_client, True
+                except Exception as e:
+                    instrumentation.record_error(node_info["name"], "connection", "connect")
+                    print(
+                        f"Failed to connect to {node_info['name']} ({node_info['host']}): {e}"
+                    )
+                    if attempt < max_retries - 1:
+                        print(f"Retrying in {delay} seconds...")
+                        await asyncio.sleep(delay)
+                    else:
+                        print(f"Exceeded maximum retries for {node_info['name']} ({node_info['host']}). Giving up.")
+            return None, False
+        finally:
+            if self.pending_connections.get(node_id) is asyncio.current_task():
+                del self.pending_connections[node_id]
+
+    async def measure_clock_offset(self, node_id, node_info, ssh_client):
+        # Maps the remote /proc/uptime onto local epoch time, assuming the
+        # read happened halfway through the round trip. A failure keeps the
+        # connection, it is tried again after CLOCK_RETRY_INTERVAL
+        start = time.time()
+        try:
+            output = await self.execute_command(
+                ssh_client,
+                BATCH_SOURCES["clock"],
+                node_info["name"],
+                "clock",
+                self.get_deadline(node_info, "clock"),
+            )
+            uptime = self.parse_uptime(output)
+        except Exception as e:
+            self.clock_retries[node_id] = time.monotonic() + CLOCK_RETRY_INTERVAL
+            print(f"Could not measure the clock offset of {node_info['name']}: {e}")
+            return
+        end = time.time()
+        self.clock_offsets[node_id] = (start + end) / 2 - uptime
+        self.clock_retries.pop(node_id, None)
+
+    def get_timestamp(self, node_id, uptime):
+        if node_id in self.clock_offsets:
+            return uptime + self.clock_offsets[node_id]
+        return time.time()
+
+    def get_deadline(self, node_info, collector):
+        return node_info.get("deadlines", {}).get(collector, self.deadlines[collector])
+
+    async def execute_command(
+        self, ssh_client, command, node=None, collector="command", deadline=None
+    ):
+        # Round trip of the remote command, including the SSH channel setup
+        start = time.perf_counter()
+        process = None
+
+        async def run():
+            nonlocal process
+            process = await ssh_client.create_process(command)
+            return await process.wait()
+
+        try:
+            result = await asyncio.wait_for(run(), deadline)
+        except asyncio.TimeoutError:
+            # Missed deadlines are counted apart from failures: the node is
+            # reachable but something on it hangs
+            instrumentation.record_error(node, collector, "deadline")
+            output = self.cancel_process(process)
+            raise DeadlineExceeded(
+                f"{collector} command did not finish within {deadline} seconds", output
+            ) from None
+        except asyncio.CancelledError:
+            self.cancel_process(process)
+            raise
+        except Exception:
+            instrumentation.record_error(node, collector, "command")
+            raise
+        instrumentation.record(node, collector, "command", time.perf_counter() - start)
+        if result.exit_status:
+            instrumentation.record_error(node, collector, "command")
+        return result.stdout.strip()
 
-            if line.startswith("%Cpu(s):"):
-                parts = line.replace("%Cpu(s):", "").split(",")
-
-                cpu_values = {}
-                for part in parts:
-                    value, metric = part.strip().split()
-                    metric = metric.strip()
-                    value = float(value.replace(",", "."))
-
-                    if metric == "us":
-                        cpu_values["cpu_user"] = round(value, 2)
-                    elif metric == "sy":
-                        cpu_values["cpu_system"] = round(value, 2)
-                    elif metric == "ni":
-                        cpu_values["cpu_nice"] = round(value, 2)
-                    elif metric == "id":
-                        cpu_values["cpu_idle"] = round(value, 2)
-                    elif metric == "wa":
-                        cpu_values["cpu_iowait"] = round(value, 2)
-                    elif metric == "hi":
-                        cpu_values["cpu_irq"] = round(value, 2)
-                    elif metric == "si":
-                        cpu_values["cpu_softirq"] = round(value, 2)
-                    elif metric == "st":
-                        cpu_values["cpu_steal"] = round(value, 2)
-
-                cpu_values["cpu_load"] = round(100.0 - cpu_values["cpu_idle"], 2)
-                cpu_metrics.update(cpu_values)
-                break
-
-        return system_time, cpu_metrics
-
-    def parse_free_output(self, output):
-        lines = output.split("\n")
-        system_time = lines[0]
-        memory_metrics = {}
-        swap_metrics = {}
-
-        memory_pattern = re.compile(
-            r"Mem:\s+(\d+)\s+(\d+)\s+(\d+)\s+(\d+)\s+(\d+)\s+(\d+)"
-        )
-        swap_pattern = re.compile(r"Swap:\s+(\d+)\s+(\d+)\s+(\d+)")
+    def cancel_process(self, process):
+        # Kills the remote command and closes its channel, returning what it
+        # wrote before it was stopped
+        if process is None:
+            return ""
+        output, _ = process.collect_output()
+        try:
+            process.kill()
+        except Exception:
+            pass
+        process.close()
+        return output or ""
+
+    def build_batch_command(self, sources, deadline=None):
+        # Every source is preceded by a marker line so one output can be split back up
+        commands = []
+        for source in sources:
+            command = BATCH_SOURCES[source]
+            if deadline and source in BLOCKING_SOURCES:
+                command = f"timeout -s KILL {deadline} {command}"
+            commands.append(f"echo '{SECTION_MARKER}{source}'; {command}")
+        return "; ".join(commands)
+
+    def split_sections(self, output):
+        sections = {}
+        source = None
+        lines = []
+        for line in output.split("\n"):
+            if line.startswith(SECTION_MARKER):
+                if source is not None:
+                    sections[source] = "\n".join(lines)
+                source = line[len(SECTION_MARKER):].strip()
+                lines = []
+            else:
+                lines.append(line)
+        if source is not None:
+            sections[source] = "\n".join(lines)
+        return sections
 
-        for line in lines:
-            memory_match = memory_pattern.search(line)
-            if memory_match:
-                total_mem = int(memory_match.group(1))
-                used_mem = int(memory_match.group(2))
-                free_mem = int(memory_match.group(3))
-
-                memory_metrics = {
-                    "total": round(total_mem / 1024, 2),
-                    "used": round(used_mem / 1024, 2),
-                    "free": round(free_mem / 1024, 2),
-                    "shared": round(int(memory_match.group(4)) / 1024, 2),
-                    "buff_cache": round(int(memory_match.group(5)) / 1024, 2),
-                    "available": round(int(memory_match.group(6)) / 1024, 2),
-                    "used_percent": round((used_mem / total_mem) * 100, 2),
-                }
-
-            swap_match = swap_pattern.search(line)
-            if swap_match:
-                total_mem = int(swap_match.group(1))
-                used_mem = int(swap_match.group(2))
-                free_mem = int(swap_match.group(3))
-                swap_metrics = {
-                    "total": round(int(swap_match.group(1)) / 1024, 2),
-                    "used": round(int(swap_match.group(2)) / 1024, 2),
-                    "free": round(int(swap_match.group(3)) / 1024, 2),
-                    "used_percent": round((used_mem / total_mem) * 100, 2),
-                }
-
-        return system_time, memory_metrics, swap_metrics
-
-    def parse_node_card_output(self, output):
-        lines = output.split("\n")
-        total_memory = None
-        used_memory = None
-        cpu_usage = None
+    async def collect_metrics(self, node_info, metrics):
+        ssh_client, success = await self.get_ssh_connection(node_info)
+        if not success:
+            return None
+        node_id = node_key(node_info)
+        if node_id in self.clock_retries and time.monotonic() >= self.clock_retries[node_id]:
+            await self.measure_clock_offset(node_id, node_info, ssh_client)
+
+        sources = ["clock"]
+        for metric in metrics:
+            for source in COLLECTOR_SOURCES[metric]:
+                if source not in sources:
+                    sources.append(source)
+        # A hanging source then only holds back itself, not the ones after it
+        sources.sort(key=lambda source: source in BLOCKING_SOURCES)
+
+        # The batch keeps the tightest deadline of its collectors; one that
+        # needs longer misses it and is then polled on its own
+        deadline = min(self.get_deadline(node_info, metric) for metric in metrics)
+        try:
+            output = await self.execute_command(
+                ssh_client,
+                self.build_batch_command(sources, deadline),
+                node_info["name"],
+                "+".join(metrics),
+                deadline,
+            )
+        except DeadlineExceeded as e:
+            # The sections that finished are still used; the source that was
+            # running when the deadline passed is the one that hangs
+            sections = self.split_sections(e.output.strip())
+            stalled_source = list(sections)[-1] if sections else None
+            e.stalled = [
+                metric for metric in metrics if stalled_source in COLLECTOR_SOURCES[metric]
+            ]
+            completed = [
+                metric
+                for metric in metrics
+                if metric not in e.stalled
+                and all(source in sections for source in COLLECTOR_SOURCES[metric])
+            ]
+            e.results = dict.fromkeys(metrics)
+            if completed and "clock" in sections and stalled_source != "clock":
+                for metric in completed:
+                    del e.results[metric]
+                e.results.update(self.process_sections(node_info, completed, sections))
+            raise
+
+        sections = self.split_sections(output)
+        if "clock" not in sections:
+            # The batch failed before its first source, e.g. a command that
+            # exited with an error; the metrics cannot be placed in time
+            detail = output.split("\n", 1)[0] if output else "no output"
+            raise RuntimeError(f"Batch command returned no clock reading ({detail})")
+        return self.process_sections(node_info, metrics, sections)
+
+    def process_sections(self, node_info, metrics, sections):
+        node_id = node_key(node_info)
+        uptime = self.parse_uptime(sections["clock"])
+        timestamp = self.get_timestamp(node_id, uptime)
+
+        processors = {
+            "cpu": self.process_cpu_metrics,
+            "memory": self.process_memory_metrics,
+            "disk": self.process_disk_metrics,
+            "network": self.process_network_metrics,
+            "diskio": self.process_diskio_metrics,
+        }
+        # A metric that has nothing to report yet is left out of the results
+        results = {}
+        for metric in metrics:
+            start = time.perf_counter()
+            try:
+                result = processors[metric](node_id, timestamp, uptime, sections)
+                if result is not None:
+                    results[metric] = result
+            except Exception as e:
+                instrumentation.record_error(node_info["name"], metric, "parse")
+                print(f"Error parsing {metric} metrics for {node_info['name']}: {e}")
+                results[metric] = None
+            else:
+                instrumentation.record(
+                    node_info["name"], metric, "parse", time.perf_counter() - start
+                )
+        return results
+
+    async def collect_single_metric(self, node_info, metric, empty_result):
+        results = await self.collect_metrics(node_info, [metric])
+        if results is None or results.get(metric) is None:
+            return empty_result
+        return results[metric]
+
+    def parse_uptime(self, line):
+        return float(line.split()[0])
+
+    def parse_proc_stat(self, output):
+        cpu_rows = []
+        load_avg = None
+
+        for line in output.split("\n"):
+            parts = line.split()
+            if parts and parts[0].startswith("cpu"):
+                cpu_rows.append(parts[1:len(CPU_STATES) + 1])
+            elif len(parts) == 5 and "/" in parts[3]:
+                load_avg = [float(value) for value in parts[:3]]
+
+        # Row 0 is the aggregate "cpu" line, row N is "cpu(N-1)"
+        cpu_times = np.array(cpu_rows, dtype=np.int64)
+        return cpu_times, load_avg
+
+    def calculate_cpu_usage(self, old_times, new_times):
+        deltas = new_times - old_times
+        totals = deltas.sum(axis=1, keepdims=True)
+        percentages = deltas / np.maximum(totals, 1) * 100
+
+        cpu_metrics = {
+            f"cpu_{state}": round(float(value), 2)
+            for state, value in zip(CPU_STATES, percentages[0])
+        }
+        cpu_metrics["cpu_load"] = round(100.0 - cpu_metrics["cpu_idle"], 2)
+        cpu_metrics["per_core_load"] = 100.0 - percentages[1:, CPU_STATES.index("idle")]
+        return cpu_metrics
+
+    def process_cpu_metrics(self, node_id, timestamp, uptime, sections):
+        cpu_times, load_avg = self.parse_proc_stat(sections["stat"])
+
+        # Usage comes from the previous poll; the first one only primes the
+        # cache, a delta against zero would be the average since boot
+        old_times = self.cpu_times.get(node_id)
+        self.cpu_times[node_id] = cpu_times
+        if old_times is None or old_times.shape != cpu_times.shape:
+            return None
 
-        memory_pattern = re.compile(r"Mem:\s+(\d+)\s+(\d+)\s+\d+\s+\d+\s+(\d+)")
+        cpu_metrics = {
+            "load_avg_1min": load_avg[0],
+            "load_avg_5min": load_avg[1],
+            "load_avg_15min": load_avg[2],
+        }
+        cpu_metrics.update(self.calculate_cpu_usage(old_times, cpu_times))
+        return timestamp, cpu_metrics
 
-        for line in lines:
-            memory_match = memory_pattern.search(line)
-            if memory_match:
-                total_memory = int(memory_match.group(1))
-                used_memory = int(memory_match.group(2))
-
-            if line.startswith("%Cpu(s):"):
-                parts = line.replace("%Cpu(s):", "").split(",")
-                cpu_values = {}
-                for part in parts:
-                    value, metric = part.strip().split()
-                    metric = metric.strip()
-                    value = float(value.replace(",", "."))
-                    if metric == "us":
-                        cpu_values["cpu_user"] = round(value, 2)
-                    elif metric == "sy":
-                        cpu_values["cpu_system"] = round(value, 2)
-                    elif metric == "ni":
-                        cpu_values["cpu_nice"] = round(value, 2)
-                    elif metric == "id":
-                        cpu_values["cpu_idle"] = round(value, 2)
-                cpu_values["cpu_load"] = round(100.0 - cpu_values["cpu_idle"], 2)
-                cpu_usage = cpu_values["cpu_load"]
-                break
-
-        memory_usage = (
-            round((used_memory / total_memory) * 100, 2)
-            if total_memory and used_memory
-            else None
+    async def collect_cpu_metrics(self, node_info):
+        return await self.collect_single_metric(node_info, "cpu", (None, None))
+
+    def parse_meminfo(self, output):
+        meminfo = {}
+        for line in output.split("\n"):
+            parts = line.split()
+            if len(parts) >= 2:
+                meminfo[parts[0].rstrip(":")] = int(parts[1])
+
+        # Same accounting as free: cache includes reclaimable slab
+        total_mem = meminfo["MemTotal"]
+        free_mem = meminfo["MemFree"]
+        available_mem = meminfo.get("MemAvailable", free_mem)
+        buff_cache = (
+            meminfo.get("Buffers", 0)
+            + meminfo.get("Cached", 0)
+            + meminfo.get("SReclaimable", 0)
         )
+        used_mem = total_mem - available_mem
+
+        memory_metrics = {
+            "total": round(total_mem / 1024, 2),
+            "used": round(used_mem / 1024, 2),
+            "free": round(free_mem / 1024, 2),
+            "shared": round(meminfo.get("Shmem", 0) / 1024, 2),
+            "buff_cache": round(buff_cache / 1024, 2),
+            "available": round(available_mem / 1024, 2),
+            "used_percent": round((used_mem / total_mem) * 100, 2),
+        }
 
-        return cpu_usage, memory_usage
+        total_swap = meminfo.get("SwapTotal", 0)
+        free_swap = meminfo.get("SwapFree", 0)
+        used_swap = total_swap - free_swap
+        swap_metrics = {
+            "total": round(total_swap / 1024, 2),
+            "used": round(used_swap / 1024, 2),
+            "free": round(free_swap / 1024, 2),
+            "used_percent": (
+                round((used_swap / total_swap) * 100, 2) if total_swap else 0.0
+            ),
+        }
 
-    async def collect_nodecard_metrics(self, node_info):
-        ssh_client, success = await self.get_ssh_connection(node_info)
-        if not success:
-            return None, None
-        output = await self.execute_command(ssh_client, "free && top -bn1")
-        return self.parse_node_card_output(output)
+        return memory_metrics, swap_metrics
 
-    async def collect_cpu_metrics(self, node_info):
-        ssh_client, success = await self.get_ssh_connection(node_info)
-        if not success:
-            return None, None
-        output = await self.execute_command(ssh_client, "top -bn1")
-        return self.parse_top_output(output)
+    def process_memory_metrics(self, node_id, timestamp, uptime, sections):
+        memory_metrics, swap_metrics = self.parse_meminfo(sections["meminfo"])
+        return timestamp, memory_metrics, swap_metrics
 
     async def collect_memory_metrics(self, node_info):
-        ssh_client, success = await self.get_ssh_connection(node_info)
-        if not success:
-            return None, None, None
-        output = await self.execute_command(ssh_client, "date '+%T' && free")
-        return self.parse_free_output(output)
+        return await self.collect_single_metric(
+            node_info, "memory", (None, None, None)
+        )
 
     def parse_df_output(self, output):
         lines = output.split("\n")
-        system_time = lines[0]
-        headers = lines[1].split()
         volumes = []
 
         for line in lines[1:]:
             if line:
                 parts = line.split()
-                filesystem = parts[0]
-                size = parts[1]
-                used = parts[2]
-                available = parts[3]
-                use_percent = parts[4]
-                mounted_on = parts[5]
                 volumes.append(
-                    {
-                        "filesystem": filesystem,
-                        "size": size,
-                        "used": used,
-                        "available": available,
-                        "use_percent": use_percent,
-                        "mounted_on": mounted_on,
-                    }
+                    Volume(
+                        filesystem=parts[0],
+                        size=int(parts[1]) * 1024,
+                        used=int(parts[2]) * 1024,
+                        available=int(parts[3]) * 1024,
+                        use_percent=float(parts[4].rstrip("%")),
+                        mounted_on=parts[5],
+                    )
                 )
 
-        return system_time, volumes
+        return volumes
 
     def filter_volumes(self, volumes):
-        patterns = [r"/dev/"]
         filtered_volumes = []
         for volume in volumes:
-            for pattern in patterns:
-                if re.search(pattern, volume["filesystem"]):
+            for pattern in VOLUME_PATTERNS:
+                if pattern.search(volume.filesystem):
                     filtered_volumes.append(volume)
                     break
         return filtered_volumes
 
-    async def collect_disk_metrics(self, node_info):
-        ssh_client, success = await self.get_ssh_connection(node_info)
-        if not success:
-            return None, None
-        output = await self.execute_command(ssh_client, "date '+%T' && df -h")
-        system_time, volumes_info = self.parse_df_output(output)
+    def process_disk_metrics(self, node_id, timestamp, uptime, sections):
+        volumes_info = self.parse_df_output(sections["df"])
         filtered_volumes_info = self.filter_volumes(volumes_info)
-        return system_time, filtered_volumes_info
+        return timestamp, filtered_volumes_info
+
+    async def collect_disk_metrics(self, node_info):
+        return await self.collect_single_metric(node_info, "disk", (None, None))
 
     def parse_network_stats(self, output):
         lines = output.split("\n")
         net_data = {}
         for line in lines[2:]:
-            if line:
-                parts = line.split()
-                if len(parts) < 17:
-                    continue
-                interface = parts[0].strip(":")
-                bytes_in = int(parts[1])
-                bytes_out = int(parts[9])
-                net_data[interface] = {"bytes_in": bytes_in, "bytes_out": bytes_out}
+            # Counters wider than their column run into the name ("eth0:123456789")
+            interface, _, counters = line.partition(":")
+            parts = counters.split()
+            if len(parts) < 16:
+                continue
+            interface = interface.strip()
+            bytes_in = int(parts[0])
+            bytes_out = int(parts[8])
+            net_data[interface] = {"bytes_in": bytes_in, "bytes_out": bytes_out}
         return net_data
 
     def calculate_diff(self, old_stats, new_stats, interval):
@@ -285,66 +514,35 @@ class SSHConnectionManager:
                     new_stats[interface]["bytes_out"]
                     - old_stats[interface]["bytes_out"]
                 ) / interval
-                diff_stats[interface] = {
-                    "bytes_in/s": bytes_in_diff,
-                    "bytes_out/s": bytes_out_diff,
-                }
+                diff_stats[interface] = InterfaceRates(bytes_in_diff, bytes_out_diff)
         return diff_stats
 
-    def convert_units(self, value, unit="B/s"):
-        thresholds = {
-            "B/s": 1024,
-            "KB/s": 1024,
-            "MB/s": 1024,
-            "GB/s": 1024,
-        }
-        units = ["B/s", "KB/s", "MB/s", "GB/s"]
-        index = 0
-        while value >= thresholds[unit] and index < len(units) - 1:
-            value /= 1024
-            index += 1
-            unit = units[index]
-        return f"{value:.2f} {unit}"
+    def process_network_metrics(self, node_id, timestamp, uptime, sections):
+        new_stats = self.parse_network_stats(sections["netdev"])
 
-    async def collect_network_metrics(self, node_info):
-        ssh_client, success = await self.get_ssh_connection(node_info)
-        if not success:
-            return None, None
-        interval = 1
-        command = "cat /proc/net/dev"
-
-        old_output = await self.execute_command(ssh_client, command)
-        old_stats = self.parse_network_stats(old_output)
-
-        await asyncio.sleep(interval)
-
-        new_output = await self.execute_command(ssh_client, command)
-        new_stats = self.parse_network_stats(new_output)
-        system_time = await self.execute_command(ssh_client, "date '+%T'")
-
-        diff_stats = self.calculate_diff(old_stats, new_stats, interval)
-
-        for interface in diff_stats:
-            diff_stats[interface]["bytes_in/s"] = self.convert_units(
-                diff_stats[interface]["bytes_in/s"]
-            )
-            diff_stats[interface]["bytes_out/s"] = self.convert_units(
-                diff_stats[interface]["bytes_out/s"]
-            )
+        # Rates come from the previous poll; the first one only primes the cache
+        diff_stats = {}
+        if node_id in self.network_stats:
+            old_uptime, old_stats = self.network_stats[node_id]
+            interval = uptime - old_uptime
+            if interval > 0:
+                diff_stats = self.calculate_diff(old_stats, new_stats, interval)
+        self.network_stats[node_id] = (uptime, new_stats)
+        return timestamp, diff_stats
 
-        return system_time, diff_stats
+    async def collect_network_metrics(self, node_info):
+        return await self.collect_single_metric(node_info, "network", (None, None))
 
     def parse_diskio_stats(self, output):
         lines = output.split("\n")
         disk_data = {}
-        base_drive_pattern = re.compile(r"^(sd[a-z]+|mmcblk[0-9]+)$")
         for line in lines:
             if line:
                 parts = line.split()
                 if len(parts) < 14:
                     continue
                 device = parts[2]
-                if base_drive_pattern.match(device):
+                if BASE_DRIVE_PATTERN.match(device):
                     reads_completed = int(parts[3])
                     reads_merged = int(parts[4])
                     sectors_read = int(parts[5])
@@ -394,58 +592,29 @@ class SSHConnectionManager:
                 read_bytes_per_sec = sectors_read_diff * 512
                 write_bytes_per_sec = sectors_written_diff * 512
                 io_ops_per_sec = reads_completed_diff + writes_completed_diff
-                diff_stats[device] = {
-                    "reads/s": reads_completed_diff,
-                    "writes/s": writes_completed_diff,
-                    "read_bytes/s": read_bytes_per_sec,
-                    "write_bytes/s": write_bytes_per_sec,
-                    "io_ops/s": io_ops_per_sec,
-                }
+                diff_stats[device] = DeviceRates(
+                    reads=reads_completed_diff,
+                    writes=writes_completed_diff,
+                    read_bytes=read_bytes_per_sec,
+                    write_bytes=write_bytes_per_sec,
+                    io_ops=io_ops_per_sec,
+                )
         return diff_stats
 
-    def convert_iounits(self, value, unit="B/s"):
-        thresholds = {
-            "B/s": 1024,
-            "KB/s": 1024,
-            "MB/s": 1024,
-            "GB/s": 1024,
-        }
-        units = ["B/s", "KB/s", "MB/s", "GB/s"]
-        index = 0
-        while value >= thresholds[unit] and index < len(units) - 1:
-            value /= 1024
-            index += 1
-            unit = units[index]
-        return f"{value:.2f} {unit}"
+    def process_diskio_metrics(self, node_id, timestamp, uptime, sections):
+        new_stats = self.parse_diskio_stats(sections["diskstats"])
 
-    async def collect_diskio_metrics(self, node_info):
-        ssh_client, success = await self.get_ssh_connection(node_info)
-        if not success:
-            return None, None
-        interval = 1
-
-        command = "cat /proc/diskstats"
-
-        old_output = await self.execute_command(ssh_client, command)
-        old_stats = self.parse_diskio_stats(old_output)
-
-        await asyncio.sleep(interval)
-
-        new_output = await self.execute_command(ssh_client, command)
-        new_stats = self.parse_diskio_stats(new_output)
-        system_time = await self.execute_command(ssh_client, "date '+%T'")
-
-        diff_stats = self.calculate_iodiff(old_stats, new_stats, interval)
-
-        for device in diff_stats:
-            diff_stats[device]["read_bytes/s"] = self.convert_iounits(
-                diff_stats[device]["read_bytes/s"]
-            )
-            diff_stats[device]["write_bytes/s"] = self.convert_iounits(
-                diff_stats[device]["write_bytes/s"]
-            )
+        diff_stats = {}
+        if node_id in self.diskio_stats:
+            old_uptime, old_stats = self.diskio_stats[node_id]
+            interval = uptime - old_uptime
+            if interval > 0:
+                diff_stats = self.calculate_iodiff(old_stats, new_stats, interval)
+        self.diskio_stats[node_id] = (uptime, new_stats)
+        return timestamp, diff_stats
 
-        return system_time, diff_stats
+    async def collect_diskio_metrics(self, node_info):
+        return await self.collect_single_metric(node_info, "diskio", (None, None))
 
     async def collect_system_info(self, node_info):
         ssh_client, success = await self.get_ssh_connection(node_info)
@@ -454,6 +623,9 @@ class SSHConnectionManager:
         output = await self.execute_command(
             ssh_client,
             "uname -sr && uname -m && lscpu | sed -n 's/Model name:[[:space:]]*//p' && nproc && grep -oP 'MemTotal:\\s*\\K\\d+' /proc/meminfo | awk '{printf \"%.2f GB\\n\", $1 / 1024 / 1024}' && hostname && df -BG --total | awk '/total/ {print $2}' && grep 'PRETTY_NAME' /etc/*-release | cut -d '=' -f 2 | tr -d '\"'",
+            node_info["name"],
+            "system_info",
+            self.get_deadline(node_info, "system_info"),
         )
         system_info = self.parse_system_info(output)
         return system_info
@@ -473,16 +645,57 @@ class SSHConnectionManager:
 
         return parsed_output
 
+    def get_sampler(self, node_info):
+        node_id = node_key(node_info)
+        if node_id not in self.samplers:
+            self.samplers[node_id] = NodeSampler(self, node_info)
+        return self.samplers[node_id]
+
+    def subscribe_metrics(self, node_info, callback):
+        self.get_sampler(node_info).subscribe(callback)
+
+    def unsubscribe_metrics(self, node_info, callback):
+        node_id = node_key(node_info)
+        sampler = self.samplers.get(node_id)
+        if sampler:
+            sampler.unsubscribe(callback)
+            if not sampler.subscribers:
+                del self.samplers[node_id]
+
+    def set_viewed(self, node_info, callback, viewed):
+        node_id = node_key(node_info)
+        sampler = self.samplers.get(node_id)
+        if sampler:
+            sampler.set_viewed(callback, viewed)
+
+    def get_latest_metrics(self, node_info):
+        node_id = node_key(node_info)
+        sampler = self.samplers.get(node_id)
+        if sampler:
+            return dict(sampler.latest)
+        return dict.fromkeys(NodeSampler.METRICS)
+
     async def close_all_connections(self):
         async with self.lock:
+            for task in self.pending_connections.values():
+                task.cancel()
+            self.pending_connections.clear()
             for ssh_client in self.ssh_connections.values():
                 ssh_client.close()
             self.ssh_connections.clear()
 
     async def close_ssh_connection(self, node_info):
-        node_id = f"{node_info['host']}_{node_info['user']}"
+        node_id = node_key(node_info)
 
         async with self.lock:
+            pending = self.pending_connections.pop(node_id, None)
+            if pending:
+                pending.cancel()
+            self.cpu_times.pop(node_id, None)
+            self.network_stats.pop(node_id, None)
+            self.diskio_stats.pop(node_id, None)
+            self.clock_offsets.pop(node_id, None)
+            self.clock_retries.pop(node_id, None)
             if node_id in self.ssh_connections:
                 self.ssh_connections[node_id].close()
                 del self.ssh_connections[node_id]
@@ -491,14 +704,349 @@ class SSHConnectionManager:
                 print(f"No active connection found for {node_id}.")
 
 
+# Polls one node once per tick and hands each result to every subscriber as
+# callback(metric, result); result is None when the collection failed, and a
+# metric whose first poll only primed a delta is not handed out at all. The
+# tick interval follows the node's activity within the manager's sampling
+# budget, and a node shown in a detail window is polled at least at the base
+# rate.
+class NodeSampler:
+    METRICS = ("cpu", "memory", "disk", "network", "diskio")
+    FAST_METRICS = ("cpu", "memory", "disk")
+    SLOW_METRICS = ("network", "diskio")
+    # Successful polls in a row before an isolated collector rejoins the batch
+    RECOVERY_TICKS = 30
+
+    def __init__(self, manager, node_info, fast_interval=1, slow_interval=3):
+        self.manager = manager
+        self.node_info = node_info
+        self.node_id = node_key(node_info)
+        self.fast_interval = fast_interval
+        self.slow_interval = slow_interval
+        self.slow_every = max(1, round(slow_interval / fast_interval))
+        self.interval = fast_interval
+        self.activity = NodeActivity(node_info.get("sampling", {}).get("thresholds"))
+        self.subscribers = []
+        self.viewers = set()
+        self.latest = dict.fromkeys(self.METRICS)
+        # Failed CPU polls in a row, subscribers give up on the node after a
+        # number of them
+        self.failures = 0
+        self.jobs = {}
+        # Collectors that missed a deadline poll on their own job, so a hung
+        # source only stalls itself; the value counts their successes since
+        self.isolated = {}
+
+    def subscribe(self, callback):
+        if callback in self.subscribers:
+            return
+        self.subscribers.append(callback)
+        for metric, result in self.latest.items():
+            if result is not None:
+                callback(metric, result)
+        if not self.jobs:
+            self.start()
+
+    def unsubscribe(self, callback):
+        if callback in self.subscribers:
+            self.subscribers.remove(callback)
+        self.viewers.discard(callback)
+        if not self.subscribers:
+            self.stop()
+
+    def set_viewed(self, callback, viewed):
+        if viewed and callback in self.subscribers:
+            self.viewers.add(callback)
+        else:
+            self.viewers.discard(callback)
+        if self.jobs:
+            self.adapt()
+
+    def start(self):
+        self.adapt()
+        self.jobs["batch"] = self.manager.scheduler.add(
+            self.node_id, self.node_info["name"], self.tick, self.interval
+        )
+
+    def stop(self):
+        for job in self.jobs.values():
+            self.manager.scheduler.remove(job)
+        self.jobs = {}
+        self.isolated = {}
+        self.manager.policy.remove(self.node_id)
+
+    def samples_per_poll(self):
+        return len(self.FAST_METRICS) + len(self.SLOW_METRICS) / self.slow_every
+
+    def get_job_interval(self, metric):
+        if metric in self.SLOW_METRICS:
+            return self.interval * self.slow_every
+        return self.interval
+
+    def adapt(self):
+        if self.failures:
+            # A node that stops answering is polled at the base rate whatever
+            # its activity or the budget, so it is given up on in about
+            # as many seconds as subscribers allow failed polls
+            interval = self.fast_interval
+            self.manager.policy.update(
+                self.node_id,
+                pinned=self.samples_per_poll() / interval,
+                planned=self.samples_per_poll() / interval,
+            )
+        else:
+            rate = self.activity.rate(time.monotonic())
+            if self.viewers:
+                rate = max(rate, 1)
+            interval = self.manager.policy.get_interval(
+                self.node_id, self.node_info, self.fast_interval, self.samples_per_poll(), rate
+            )
+        if interval == self.interval:
+            return
+        self.interval = interval
+        for metric, job in self.jobs.items():
+            self.manager.scheduler.reschedule(job, self.get_job_interval(metric))
+
+    def publish(self, metric, result):
+        if metric == "cpu":
+            self.failures = self.failures + 1 if result is None else 0
+        self.activity.record(metric, result, time.monotonic())
+        self.latest[metric] = result
+        for callback in list(self.subscribers):
+            try:
+                callback(metric, result)
+            except Exception as e:
+                print(f"Error delivering {metric} metrics for {self.node_info['name']}: {e}")
+
+    async def collect(self, metrics):
+        stalled = []
+        try:
+            results = await self.manager.collect_metrics(self.node_info, metrics)
+        except DeadlineExceeded as e:
+            print(f"Error collecting metrics for {self.node_info['name']}: {e}")
+            results = e.results
+            stalled = e.stalled
+        except Exception as e:
+            print(f"Error collecting metrics for {self.node_info['name']}: {e}")
+            results = None
+
+        for metric in metrics:
+            if results is not None and metric not in results:
+                # Only primed a delta, there is no sample to hand out yet
+                continue
+            self.publish(metric, results[metric] if results is not None else None)
+        return stalled
+
+    async def tick(self, number):
+        # One framed command per tick, slow metrics ride along every few ticks
+        metrics = [metric for metric in self.FAST_METRICS if metric not in self.isolated]
+        if number % self.slow_every == 0:
+            metrics.extend(
+                metric for metric in self.SLOW_METRICS if metric not in self.isolated
+            )
+        if metrics:
+            for metric in await self.collect(metrics):
+                self.isolate(metric)
+        if self.jobs:
+            self.adapt()
+
+    def isolate(self, metric):
+        if metric in self.isolated or "batch" not in self.jobs:
+            return
+        print(f"Polling {metric} of {self.node_info['name']} separately after a missed deadline")
+        self.isolated[metric] = 0
+
+        async def tick_isolated(number):
+            start = time.perf_counter()
+            stalled = await self.collect([metric])
+            elapsed = time.perf_counter() - start
+            # Only polls that would have kept up with the batch count towards rejoining it
+            if stalled or self.latest[metric] is None or elapsed >= self.batch_deadline(metric):
+                self.isolated[metric] = 0
+                return
+            self.isolated[metric] += 1
+            if self.isolated[metric] >= self.RECOVERY_TICKS:
+                self.rejoin(metric)
+
+        self.jobs[metric] = self.manager.scheduler.add(
+            f"{self.node_id}/{metric}",
+            self.node_info["name"],
+            tick_isolated,
+            self.get_job_interval(metric),
+        )
+
+    def batch_deadline(self, joining):
+        return min(
+            self.manager.get_deadline(self.node_info, metric)
+            for metric in self.METRICS
+            if metric not in self.isolated or metric == joining
+        )
+
+    def rejoin(self, metric):
+        print(f"Polling {metric} of {self.node_info['name']} with the other metrics again")
+        del self.isolated[metric]
+        self.manager.scheduler.remove(self.jobs.pop(metric))
+
+
+class ScheduledJob:
+    def __init__(self, key, node, callback, interval, phase):
+        self.key = key
+        self.node = node
+        self.callback = callback
+        self.interval = interval
+        self.phase = phase
+        self.number = 0
+        self.due = None
+        self.handle = None
+        self.task = None
+        self.overruns = 0
+        self.missed = 0
+
+
+# Fires every job at a fixed rate: due times advance by exactly one interval,
+# so the period does not stretch by the time a collection takes. Each job
+# sits at its own phase of the interval, derived from its key, which spreads
+# the polls of many nodes evenly instead of sending them all at once. A job
+# whose previous run is still going skips the tick instead of stacking up.
+class CollectionScheduler:
+    def __init__(self):
+        self.jobs = {}
+
+    def get_phase(self, key, interval):
+        return zlib.crc32(key.encode()) / 2**32 * interval
+
+    def add(self, key, node, callback, interval):
+        self.remove(self.jobs.get(key))
+        job = ScheduledJob(key, node, callback, interval, self.get_phase(key, interval))
+        self.schedule(job)
+        self.jobs[key] = job
+        return job
+
+    def schedule(self, job, earliest=None):
+        loop = asyncio.get_event_loop()
+        if earliest is None:
+            earliest = loop.time()
+        # Phases are taken on a grid shared by all jobs of the same interval
+        job.due = earliest - earliest % job.interval + job.phase
+        if job.due <= earliest:
+            job.due += job.interval
+        job.handle = loop.call_at(job.due, self.fire, job)
+
+    # Moves a job to another interval without cancelling a run in progress.
+    # The next run stays at least one new interval after the last one, so a
+    # job switching intervals does not fire more often than either of them
+    def reschedule(self, job, interval):
+        if self.jobs.get(job.key) is not job:
+            return
+        job.handle.cancel()
+        last_due = job.due - job.interval
+        job.interval = interval
+        job.phase = self.get_phase(job.key, interval)
+        self.schedule(job, max(last_due + interval, asyncio.get_event_loop().time()))
+
+    def remove(self, job):
+        if job is None:
+            return
+        if self.jobs.get(job.key) is job:
+            del self.jobs[job.key]
+        job.handle.cancel()
+        if job.task:
+            job.task.cancel()
+
+    def fire(self, job):
+        loop = asyncio.get_event_loop()
+        now = loop.time()
+        instrumentation.record(job.node, "scheduler", "schedule", now - job.due)
+
+        # Ticks the loop was too busy to fire are dropped, not run in a burst
+        missed = int((now - job.due) // job.interval)
+        if missed:
+            job.missed += missed
+            instrumentation.record_error(job.node, "scheduler", "schedule")
+            job.number += missed
+            job.due += missed * job.interval
+
+        if job.task is not None and not job.task.done():
+            job.overruns += 1
+            instrumentation.record_error(job.node, "scheduler", "schedule")
+        else:
+            job.task = asyncio.ensure_future(job.callback(job.number))
+
+        job.number += 1
+        job.due += job.interval
+        job.handle = loop.call_at(job.due, self.fire, job)
+
+
+# Retries failed nodes in the background with jittered exponential backoff.
+# After failure_threshold misses in a row the node's circuit opens and it is
+# only probed once every open_duration seconds until it answers again.
+class ReconnectSupervisor:
+    def __init__(
+        self,
+        manager,
+        base_delay=2,
+        max_delay=120,
+        failure_threshold=8,
+        open_duration=600,
+    ):
+        self.manager = manager
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.failure_threshold = failure_threshold
+        self.open_duration = open_duration
+        self.tasks = {}
+
+    def watch(self, node_info, on_reconnect):
+        node_id = node_key(node_info)
+        if node_id not in self.tasks:
+            self.tasks[node_id] = asyncio.ensure_future(
+                self.supervise(node_id, node_info, on_reconnect)
+            )
+
+    def unwatch(self, node_info):
+        node_id = node_key(node_info)
+        task = self.tasks.pop(node_id, None)
+        if task:
+            task.cancel()
+
+    def get_delay(self, failures):
+        if failures >= self.failure_threshold:
+            delay = self.open_duration
+        else:
+            delay = min(self.max_delay, self.base_delay * 2**failures)
+        return random.uniform(delay / 2, delay)
+
+    async def supervise(self, node_id, node_info, on_reconnect):
+        failures = 0
+        try:
+            while True:
+                await asyncio.sleep(self.get_delay(failures))
+
+                if node_id in self.manager.ssh_connections:
+                    await self.manager.close_ssh_connection(node_info)
+                ssh_client, connected = await self.manager.get_ssh_connection(node_info)
+                if connected:
+                    print(f"Automatically reconnected to {node_info['name']} ({node_info['host']})")
+                    on_reconnect(node_info)
+                    return
+
+                failures += 1
+                if failures == self.failure_threshold:
+                    print(
+                        f"Circuit opened for {node_info['name']} ({node_info['host']}), "
+                        f"probing every {self.open_duration} seconds"
+                    )
+        finally:
+            if self.tasks.get(node_id) is asyncio.current_task():
+                del self.tasks[node_id]
+
+
 ssh_manager = SSHConnectionManager()
+reconnect_supervisor = ReconnectSupervisor(ssh_manager)
 
 async def get_ssh_connection(node_info):
     return await ssh_manager.get_ssh_connection(node_info)
 
-async def collect_nodecard_metrics(node_info):
-    return await ssh_manager.collect_nodecard_metrics(node_info)
-
 async def collect_cpu_metrics(node_info):
     return await ssh_manager.collect_cpu_metrics(node_info)
 
@@ -517,5 +1065,32 @@ async def collect_diskio_metrics(node_info):
 async def collect_system_info(node_info):
     return await ssh_manager.collect_system_info(node_info)
 
+def subscribe_metrics(node_info, callback):
+    ssh_manager.subscribe_metrics(node_info, callback)
+
+def unsubscribe_metrics(node_info, callback):
+    ssh_manager.unsubscribe_metrics(node_info, callback)
+
+def get_latest_metrics(node_info):
+    return ssh_manager.get_latest_metrics(node_info)
+
+def set_viewed(node_info, callback, viewed):
+    ssh_manager.set_viewed(node_info, callback, viewed)
+
+def set_sample_budget(budget):
+    ssh_manager.policy.budget = budget
+
+def get_sampling_policy():
+    return ssh_manager.policy
+
+def watch_reconnect(node_info, on_reconnect):
+    reconnect_supervisor.watch(node_info, on_reconnect)
+
+def unwatch_reconnect(node_info):
+    reconnect_supervisor.unwatch(node_info)
+
+async def close_all_connections():
+    await ssh_manager.close_all_connections()
+
 async def close_ssh_connection(node_info):
     await ssh_manager.close_ssh_connection(node_info)
@@ -1,6 +1,7 @@
 import tkinter as tk
 import asyncio
-from metrics import collect_nodecard_metrics
+from metrics import subscribe_metrics, unsubscribe_metrics
+from timeseries import NodeHistory
 from add_edit_node_window import EditNodeWindow
 
 class NodeCard(tk.Frame):
@@ -37,6 +38,8 @@ class NodeCard(tk.Frame):
         self.failed_attempts = 0
         self.max_failed_attempts = 20
         self.failed = False
+        store = app.history_store.get_node(node_info) if app.history_store else None
+        self.history = NodeHistory(store)
 
         self.config(width=width, height=height)
         self.grid_propagate(False)
@@ -63,35 +66,35 @@ class NodeCard(tk.Frame):
         self.remove_button = tk.Button(self, text="Remove", command=self.remove_node)
         self.remove_button.pack()
 
-        self.schedule_update()
+        subscribe_metrics(self.node_info, self.on_metrics)
 
-    def schedule_update(self):
-        self.update_metrics()
-        self.after(1000, self.schedule_update)
-
-    def update_metrics(self):
+    def on_metrics(self, metric, result):
         if self.failed:  # Do not update metrics if the node has failed
             return
 
-        async def fetch_metrics():
-            try:
-                cpu_usage, memory_usage = await collect_nodecard_metrics(self.node_info)
-                if cpu_usage is None or memory_usage is None:
-                    raise Exception("Failed to fetch metrics")
-                self.cpu_label.config(text=f"CPU: {cpu_usage}%")
-                self.memory_label.config(text=f"Memory: {memory_usage}%")
-                self.failed_attempts = 0
-            except Exception as e:
-                print(f"Error fetching metrics for {self.node_info['name']}: {e}")
+        self.history.record(metric, result)
+        self.app.aggregator.record(self, metric, result)
+        if self.app.exporter:
+            self.app.exporter.record(self.node_info, metric, result)
+
+        if metric == "cpu":
+            if result is None:
+                print(f"Error fetching metrics for {self.node_info['name']}: Failed to fetch metrics")
                 self.failed_attempts += 1
                 if self.failed_attempts >= self.max_failed_attempts:
                     self.failed = True
+                    unsubscribe_metrics(self.node_info, self.on_metrics)
                     self.after(0, self.on_fail, self)
-
-        asyncio.ensure_future(fetch_metrics())
+                return
+            system_time, cpu_metrics = result
+            self.cpu_label.config(text=f"CPU: {cpu_metrics['cpu_load']}%")
+            self.failed_attempts = 0
+        elif metric == "memory" and result is not None:
+            system_time, memory_metrics, swap_metrics = result
+            self.memory_label.config(text=f"Memory: {memory_metrics['used_percent']}%")
 
     def show_details(self):
-        self.on_click(self.node_info)
+        self.on_click(self)
 
     def edit_node(self):
         EditNodeWindow(self.app, self.node_info, self.on_edit)
@@ -104,6 +107,13 @@ class NodeCard(tk.Frame):
         self.node_info.update(updated_info)
         self.label.config(text=updated_info["name"])
 
+    def destroy(self):
+        unsubscribe_metrics(self.node_info, self.on_metrics)
+        self.app.aggregator.remove(self)
+        if self.app.exporter:
+            self.app.exporter.remove(self.node_info)
+        super().destroy()
+
 
 class FailedNodeCard(tk.Frame):
     def __init__(
@@ -147,7 +157,7 @@ class FailedNodeCard(tk.Frame):
         self.label.pack()
 
         self.reconnect_button = tk.Button(
-            self, text="Reconnect", command=lambda: asyncio.create_task(self.reconnect_node())
+            self, text="Reconnect", command=lambda: asyncio.ensure_future(self.reconnect_node())
         )
         self.reconnect_button.pack()
 
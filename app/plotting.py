@@ -0,0 +1,91 @@
+import datetime
+import time
+import numpy as np
+from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+from matplotlib.ticker import FuncFormatter, MaxNLocator
+
+
+# Tick labels for a span of up to so many seconds
+TIME_FORMATS = ((3600, "%H:%M:%S"), (86400, "%H:%M"), (float("inf"), "%a %H:%M"))
+
+
+def format_time_tick(timestamp, position=None, time_format="%H:%M:%S"):
+    return datetime.datetime.fromtimestamp(timestamp).strftime(time_format)
+
+
+# Reports how long every draw of the figure took, draw_idle defers the actual
+# rasterization until Tk is idle so it cannot be timed at the call site
+class TimedCanvas(FigureCanvasTkAgg):
+    def __init__(self, figure, master, on_draw):
+        super().__init__(figure, master)
+        self.on_draw = on_draw
+
+    def draw(self):
+        start = time.perf_counter()
+        super().draw()
+        self.on_draw(time.perf_counter() - start)
+
+
+# Artists are created once and then only moved with set_data, tick labels are
+# produced by a formatter at draw time instead of being rebuilt every sample
+class LinePlot:
+    def __init__(self, ax, title, label, color=None, ylim=None):
+        self.ax = ax
+        (self.line,) = ax.plot([], [], label=label, color=color)
+        self.legend = ax.legend(loc="upper left")
+        self.time_format = TIME_FORMATS[0][1]
+        ax.set_title(title)
+        ax.xaxis.set_major_locator(MaxNLocator(6))
+        ax.xaxis.set_major_formatter(FuncFormatter(self.format_tick))
+        if ylim is not None:
+            ax.set_ylim(*ylim)
+
+    def format_tick(self, timestamp, position=None):
+        return format_time_tick(timestamp, position, self.time_format)
+
+    def set_title(self, title):
+        if self.ax.get_title() != title:
+            self.ax.set_title(title)
+
+    def set_label(self, label):
+        if self.line.get_label() != label:
+            self.line.set_label(label)
+            self.legend.get_texts()[0].set_text(label)
+
+    def update(self, timestamps, values, start_time, end_time, ylim=None):
+        self.line.set_data(timestamps, values)
+        self.ax.set_xlim(start_time, end_time)
+        span = end_time - start_time
+        self.time_format = next(time_format for limit, time_format in TIME_FORMATS if span <= limit)
+        if ylim is not None:
+            low, high = ylim
+            if low == high:
+                high = low + 1
+            self.ax.set_ylim(low, high)
+
+
+class PiePlot:
+    def __init__(self, ax, title, labels, colors):
+        self.ax = ax
+        self.wedges, self.texts, self.autotexts = ax.pie(
+            [1] * len(labels), labels=labels, autopct="%1.1f%%", colors=colors
+        )
+        ax.set_title(title)
+
+    def update(self, values):
+        total = sum(values) or 1
+        angle = 0.0
+        for wedge, text, autotext, value in zip(
+            self.wedges, self.texts, self.autotexts, values
+        ):
+            sweep = 360.0 * value / total
+            wedge.set_theta1(angle)
+            wedge.set_theta2(angle + sweep)
+
+            middle = np.deg2rad(angle + sweep / 2)
+            x, y = np.cos(middle), np.sin(middle)
+            text.set_position((1.1 * x, 1.1 * y))
+            text.set_horizontalalignment("left" if x >= 0 else "right")
+            autotext.set_position((0.6 * x, 0.6 * y))
+            autotext.set_text(f"{100 * value / total:.1f}%")
+            angle += sweep
@@ -0,0 +1,146 @@
+import math
+
+# Samples per second the whole cluster may cost, shared out between nodes
+DEFAULT_SAMPLE_BUDGET = 2000
+# Intervals a node can be polled at. Nodes on the same step share a phase grid
+# in the scheduler, and small changes in demand do not reschedule anything.
+# No node is polled faster than the first step, whatever its config says
+INTERVAL_STEPS = (0.5, 0.75, 1, 1.5, 2, 2.5, 3, 4, 5, 7.5, 10, 15, 20, 30, 45, 60)
+# Poll rate relative to the base interval for each activity level
+ACTIVITY_RATES = {"hot": 2, "normal": 1, "stable": 0.5, "idle": 0.2}
+# Percent at which a metric puts its node under closer watch; nodes can
+# override them with "thresholds" in the "sampling" entry of their config
+ALERT_THRESHOLDS = {"cpu": 90, "memory": 90, "disk": 90}
+# Percentage points between the short and long-term average of a metric above
+# which it changes fast, and below which it counts as stable
+CHANGE_FAST = 15
+CHANGE_STABLE = 3
+# CPU load in percent below which a stable node counts as idle
+IDLE_LOAD = 5
+# Time constants of the short and long-term averages, in seconds
+SHORT_TERM = 5
+LONG_TERM = 60
+# Seconds a node stays hot after its last alert or fast change
+HOT_HOLD = 30
+
+
+# Short and long-term exponential averages of one metric. Their weights follow
+# the time between samples, so they mean the same at any poll rate
+class Trend:
+    def __init__(self):
+        self.short = None
+        self.long = None
+        self.updated = None
+
+    def update(self, value, now):
+        if self.short is None:
+            self.short = self.long = value
+        else:
+            elapsed = now - self.updated
+            self.short += (value - self.short) * (1 - math.exp(-elapsed / SHORT_TERM))
+            self.long += (value - self.long) * (1 - math.exp(-elapsed / LONG_TERM))
+        self.updated = now
+
+    def change(self):
+        return abs(self.short - self.long) if self.short is not None else 0.0
+
+
+# Classifies a node as hot, normal, stable or idle from the samples it
+# delivers: hot while a metric is over its threshold or moving fast, stable
+# when CPU and memory stay flat, and idle when it is stable with no CPU load
+class NodeActivity:
+    def __init__(self, thresholds=None):
+        self.thresholds = dict(ALERT_THRESHOLDS, **(thresholds or {}))
+        self.trends = {"cpu": Trend(), "memory": Trend()}
+        self.hot_until = 0
+
+    def record(self, metric, result, now):
+        if result is None:
+            return
+        if metric == "cpu":
+            value = result[1]["cpu_load"]
+        elif metric == "memory":
+            value = result[1]["used_percent"]
+        elif metric == "disk":
+            value = max((volume.use_percent for volume in result[1]), default=0.0)
+        else:
+            return
+
+        trend = self.trends.get(metric)
+        if trend is not None:
+            trend.update(value, now)
+            # A single busy sample is noise, the short-term average has to cross
+            value = trend.short
+        if value >= self.thresholds[metric] or (trend and trend.change() >= CHANGE_FAST):
+            self.hot_until = now + HOT_HOLD
+
+    def level(self, now):
+        if now < self.hot_until:
+            return "hot"
+        trends = [trend for trend in self.trends.values() if trend.short is not None]
+        if not trends or max(trend.change() for trend in trends) >= CHANGE_STABLE:
+            return "normal"
+        cpu = self.trends["cpu"]
+        if cpu.short is not None and cpu.short < IDLE_LOAD:
+            return "idle"
+        return "stable"
+
+    def rate(self, now):
+        return ACTIVITY_RATES[self.level(now)]
+
+
+# Shares a budget of samples per second between all sampled nodes. Every node
+# asks for a rate from its activity; when the asks add up to more than the
+# budget, all adaptive nodes slow down by the same factor, so hot nodes keep
+# their lead over idle ones. Nodes with a fixed "interval" in their "sampling"
+# config are not slowed down, their samples come off the budget first. The
+# sums are kept up to date per node, so a poll costs the same at any size.
+class SamplingPolicy:
+    def __init__(self, budget=DEFAULT_SAMPLE_BUDGET):
+        self.budget = budget
+        self.nodes = {}
+        self.demand = 0.0
+        self.pinned = 0.0
+        self.planned = 0.0
+
+    def update(self, node, demand=0.0, pinned=0.0, planned=0.0):
+        old_demand, old_pinned, old_planned = self.nodes.pop(node, (0.0, 0.0, 0.0))
+        if demand or pinned or planned:
+            self.nodes[node] = (demand, pinned, planned)
+        if not self.nodes:
+            # Nothing left to add up, drop the rounding errors of the sums
+            self.demand = self.pinned = self.planned = 0.0
+            return
+        self.demand += demand - old_demand
+        self.pinned += pinned - old_pinned
+        self.planned += planned - old_planned
+
+    def remove(self, node):
+        self.update(node)
+
+    def scale(self):
+        available = max(0.0, self.budget - self.pinned)
+        if self.demand <= available:
+            return 1.0
+        return available / self.demand
+
+    def get_interval(self, node, node_info, base_interval, samples_per_poll, rate):
+        settings = node_info.get("sampling", {})
+        if "interval" in settings:
+            interval = max(settings["interval"], INTERVAL_STEPS[0])
+            self.update(node, pinned=samples_per_poll / interval, planned=samples_per_poll / interval)
+            return interval
+
+        wanted = base_interval / rate
+        # Counted before scaling, so the factor does not feed back into itself
+        self.update(node, demand=samples_per_poll / wanted)
+        scale = self.scale()
+        interval = wanted / scale if scale else INTERVAL_STEPS[-1]
+        interval = next((step for step in INTERVAL_STEPS if step >= interval), interval)
+        interval = min(
+            max(interval, settings.get("min_interval", INTERVAL_STEPS[0])),
+            settings.get("max_interval", INTERVAL_STEPS[-1]),
+        )
+        interval = max(interval, INTERVAL_STEPS[0])
+        self.update(node, demand=samples_per_poll / wanted, planned=samples_per_poll / interval)
+        return interval
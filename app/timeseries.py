@@ -0,0 +1,485 @@
+import asyncio
+import time
+import numpy as np
+from metrics import InterfaceRates, DeviceRates
+from sampling import INTERVAL_STEPS
+
+# Ten minutes of history at the fastest sampling rate plus headroom
+HISTORY_SECONDS = 600
+HISTORY_CAPACITY = int(HISTORY_SECONDS / INTERVAL_STEPS[0] * 1.25)
+
+CPU_METRICS = [
+    "cpu_load",
+    "cpu_user",
+    "cpu_nice",
+    "cpu_system",
+    "cpu_iowait",
+    "cpu_irq",
+    "cpu_softirq",
+    "load_avg_1min",
+    "load_avg_5min",
+    "load_avg_15min",
+]
+CORE_HEATMAP_SAMPLES = 120
+# Rollups kept next to the raw samples as (seconds per bucket, buckets kept).
+# Every view is drawn from the finest tier that covers it, so a chart never
+# has more than about 1440 points whatever span it shows
+ROLLUP_TIERS = ((10, 360), (60, 1440), (600, 1008))
+VIEW_SPANS = {"10 min": HISTORY_SECONDS, "1 h": 3600, "24 h": 86400, "7 d": 7 * 86400}
+ROLLUP_STATS = ("min", "max", "mean", "last")
+
+
+class RingSeries:
+    def __init__(self, capacity=HISTORY_CAPACITY, columns=("value",)):
+        self.capacity = capacity
+        self.columns = list(columns)
+        self.index = {name: i for i, name in enumerate(self.columns)}
+        # Every row is stored twice, at i and i + capacity, so the newest rows
+        # are always one contiguous slice and windows can be returned as views
+        self.times = np.zeros(capacity * 2)
+        self.values = np.zeros((capacity * 2, len(self.columns)))
+        self.head = 0
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def append(self, timestamp, values):
+        i = self.head
+        j = i + self.capacity
+        self.times[i] = self.times[j] = timestamp
+        self.values[i] = self.values[j] = values
+        self.head = (i + 1) % self.capacity
+        if self.size < self.capacity:
+            self.size += 1
+
+    def extend(self, times, values):
+        values = np.reshape(values, (len(times), -1))[-self.capacity:]
+        times = times[-self.capacity:]
+        if not len(times):
+            return
+        i = (self.head + np.arange(len(times))) % self.capacity
+        self.times[i] = self.times[i + self.capacity] = times
+        self.values[i] = self.values[i + self.capacity] = values
+        self.head = (self.head + len(times)) % self.capacity
+        self.size = min(self.capacity, self.size + len(times))
+
+    def clear(self):
+        self.head = 0
+        self.size = 0
+
+    def window(self, start_time=None):
+        end = self.head + self.capacity
+        begin = end - self.size
+        if start_time is not None:
+            begin += int(np.searchsorted(self.times[begin:end], start_time))
+        return self.times[begin:end], self.values[begin:end]
+
+    def column(self, name, start_time=None):
+        times, values = self.window(start_time)
+        return times, values[:, self.index[name]]
+
+    def latest(self):
+        if not self.size:
+            return None, None
+        i = (self.head - 1) % self.capacity
+        return self.times[i], self.values[i]
+
+    def min(self, start_time=None):
+        times, values = self.window(start_time)
+        if not len(times):
+            return np.zeros(len(self.columns))
+        return values.min(axis=0)
+
+    def max(self, start_time=None):
+        times, values = self.window(start_time)
+        if not len(times):
+            return np.zeros(len(self.columns))
+        return values.max(axis=0)
+
+
+# Min, max, mean and last of every column per bucket of `width` seconds, in a
+# ring of fixed size. Samples are added to the open bucket; once a sample
+# falls into the next bucket the open one is stored and handed on to the
+# next, coarser tier, which merges it like a sample that counts several times.
+class RollupTier:
+    def __init__(self, width, capacity, columns):
+        self.width = width
+        self.capacity = capacity
+        self.columns = list(columns)
+        self.index = {name: i for i, name in enumerate(self.columns)}
+        self.next = None
+        # Stored rollups are float32, the open bucket adds up in float64
+        self.times = np.zeros(capacity)
+        self.stats = {
+            stat: np.zeros((capacity, len(self.columns)), np.float32) for stat in ROLLUP_STATS
+        }
+        self.head = 0
+        self.size = 0
+        self.bucket = None
+        self.count = 0
+        self.sum = np.zeros(len(self.columns))
+        self.low = np.zeros(len(self.columns))
+        self.high = np.zeros(len(self.columns))
+        self.last = np.zeros(len(self.columns))
+        self.updated = None
+
+    def __len__(self):
+        return self.size
+
+    def add(self, timestamp, values):
+        self.merge(timestamp, 1, values, values, values, values)
+
+    def merge(self, timestamp, count, total, low, high, last):
+        bucket = timestamp - timestamp % self.width
+        if bucket != self.bucket:
+            if self.count:
+                self.commit()
+            self.bucket = bucket
+            self.count = 0
+            self.sum[:] = 0
+            self.low[:] = low
+            self.high[:] = high
+        else:
+            np.minimum(self.low, low, out=self.low)
+            np.maximum(self.high, high, out=self.high)
+        self.count += count
+        self.sum += total
+        self.last[:] = last
+        self.updated = timestamp
+
+    def commit(self):
+        i = self.head
+        self.times[i] = self.bucket
+        self.stats["min"][i] = self.low
+        self.stats["max"][i] = self.high
+        self.stats["mean"][i] = self.sum / self.count
+        self.stats["last"][i] = self.last
+        self.head = (i + 1) % self.capacity
+        if self.size < self.capacity:
+            self.size += 1
+        if self.next is not None:
+            self.next.merge(self.bucket, self.count, self.sum, self.low, self.high, self.last)
+        self.count = 0
+
+    # Bulk version of add for filling the tier from stored history. Samples
+    # have to be newer than the ones added before
+    def extend(self, times, values):
+        if not len(times):
+            return
+        times = np.asarray(times, np.float64)
+        values = np.asarray(values, np.float64).reshape(len(times), -1)
+        self.merge_rows(times, np.ones(len(times), np.int64), values, values, values, values)
+
+    # Bulk version of merge. Completed buckets are handed on to the next tier
+    # in one go, as commit does one at a time, so every tier counts each
+    # sample once whether it arrived alone or in bulk
+    def merge_rows(self, times, counts, totals, lows, highs, lasts):
+        buckets = times - times % self.width
+        starts = np.flatnonzero(np.diff(buckets, prepend=np.nan))
+        ends = np.append(starts[1:], len(times))
+        bucket_times = buckets[starts]
+        counts = np.add.reduceat(counts, starts)
+        sums = np.add.reduceat(totals, starts)
+        lows = np.minimum.reduceat(lows, starts)
+        highs = np.maximum.reduceat(highs, starts)
+        lasts = lasts[ends - 1]
+
+        if self.count:
+            if bucket_times[0] == self.bucket:
+                counts[0] += self.count
+                sums[0] += self.sum
+                np.minimum(lows[0], self.low, out=lows[0])
+                np.maximum(highs[0], self.high, out=highs[0])
+            else:
+                self.commit()
+
+        # All but the newest bucket are complete, only the newest of them fit
+        done = len(starts) - 1
+        kept = slice(max(0, done - self.capacity), done)
+        kept_count = kept.stop - kept.start
+        if kept_count:
+            i = (self.head + np.arange(kept_count)) % self.capacity
+            self.times[i] = bucket_times[kept]
+            self.stats["min"][i] = lows[kept]
+            self.stats["max"][i] = highs[kept]
+            self.stats["mean"][i] = sums[kept] / counts[kept, None]
+            self.stats["last"][i] = lasts[kept]
+            self.head = (self.head + kept_count) % self.capacity
+            self.size = min(self.capacity, self.size + kept_count)
+        if done and self.next is not None:
+            self.next.merge_rows(
+                bucket_times[:done],
+                counts[:done],
+                sums[:done],
+                lows[:done],
+                highs[:done],
+                lasts[:done],
+            )
+
+        self.bucket = bucket_times[-1]
+        self.count = counts[-1]
+        self.sum[:] = sums[-1]
+        self.low[:] = lows[-1]
+        self.high[:] = highs[-1]
+        self.last[:] = lasts[-1]
+        self.updated = times[-1]
+
+    def get_rows(self, stat):
+        # Oldest first, a copy of at most `capacity` rows. The open bucket is
+        # included as of its newest sample so a chart reaches the present
+        i = (self.head - self.size + np.arange(self.size)) % self.capacity
+        times = self.times[i] + self.width / 2
+        values = self.stats[stat][i]
+        if self.count:
+            open_values = {
+                "min": self.low,
+                "max": self.high,
+                "mean": self.sum / self.count,
+                "last": self.last,
+            }[stat]
+            times = np.append(times, min(self.bucket + self.width / 2, self.updated))
+            values = np.vstack([values, open_values])
+        return times, values
+
+    def window(self, start_time=None, stat="mean"):
+        times, values = self.get_rows(stat)
+        if start_time is not None:
+            begin = int(np.searchsorted(times, start_time))
+            times, values = times[begin:], values[begin:]
+        return times, values
+
+    def column(self, name, start_time=None, stat="mean"):
+        times, values = self.window(start_time, stat)
+        return times, values[:, self.index[name]]
+
+    def min(self, start_time=None):
+        times, values = self.window(start_time, "min")
+        if not len(times):
+            return np.zeros(len(self.columns))
+        return values.min(axis=0)
+
+    def max(self, start_time=None):
+        times, values = self.window(start_time, "max")
+        if not len(times):
+            return np.zeros(len(self.columns))
+        return values.max(axis=0)
+
+
+# Raw samples for the last ten minutes plus cascading rollup tiers for up to
+# a week, all of fixed size however long the node is watched. The tiers are
+# only kept once a longer span has been looked at; until then `tiers` is None
+# and every span is drawn from the raw samples
+class TieredSeries(RingSeries):
+    def __init__(self, capacity=HISTORY_CAPACITY, columns=("value",), tiers=ROLLUP_TIERS):
+        super().__init__(capacity, columns)
+        self.tier_sizes = tiers
+        self.tiers = None
+
+    def create_tiers(self):
+        tiers = [RollupTier(width, count, self.columns) for width, count in self.tier_sizes]
+        for tier, next_tier in zip(tiers, tiers[1:]):
+            tier.next = next_tier
+        return tiers
+
+    def append(self, timestamp, values):
+        super().append(timestamp, values)
+        if self.tiers is not None:
+            self.tiers[0].add(timestamp, np.asarray(values, np.float64))
+
+    def extend(self, times, values):
+        super().extend(times, values)
+        if self.tiers is not None:
+            self.tiers[0].extend(times, values)
+
+    def start_tiers(self, tiers):
+        # Takes tiers built from older samples and adds the raw samples that
+        # arrived after their newest one
+        times, values = self.window()
+        if tiers[0].updated is not None:
+            newer = times > tiers[0].updated
+            times, values = times[newer], values[newer]
+        tiers[0].extend(times, values)
+        self.tiers = tiers
+
+    def clear(self):
+        super().clear()
+        self.tiers = None
+
+    # The raw samples or the finest tier that covers `span` seconds
+    def resolution(self, span):
+        if span <= HISTORY_SECONDS or self.tiers is None:
+            return self
+        for tier in self.tiers:
+            if tier.width * tier.capacity >= span:
+                return tier
+        return self.tiers[-1]
+
+
+# Everything sampled for one node, kept whether or not its detail window is
+# open so a window can be filled from it as soon as it is created. With a
+# store, every sample is also written to disk and the last ten minutes are
+# read back when the history is created, so charts survive a restart. The
+# rest of the week is only read into rollup tiers once a longer span is
+# looked at, for the series of that tab and on a worker thread.
+class NodeHistory:
+    def __init__(self, store=None):
+        self.cpu = TieredSeries(columns=CPU_METRICS)
+        self.cores = None
+        self.memory = TieredSeries(columns=["used_percent"])
+        self.swap = TieredSeries(columns=["used_percent"])
+        self.volumes = {}
+        self.disk = {}
+        self.network = {}
+        self.diskio = {}
+        self.last_times = {}
+        self.store = store
+        self.loading = set()
+        if store is not None:
+            self.load()
+
+    def get_series(self, name, columns):
+        kind, _, key = name.partition("/")
+        if kind == "cpu":
+            return self.cpu
+        if kind == "memory":
+            return self.memory
+        if kind == "swap":
+            return self.swap
+        groups = {
+            "disk": (self.disk, ["usage_percent"]),
+            "network": (self.network, InterfaceRates._fields),
+            "diskio": (self.diskio, DeviceRates._fields),
+        }
+        if kind not in groups or not key:
+            return None
+        group, group_columns = groups[kind]
+        if key not in group:
+            group[key] = TieredSeries(columns=group_columns)
+        return group[key]
+
+    def load(self):
+        metrics = {"swap": "memory"}
+        since = time.time() - HISTORY_SECONDS
+        for name in self.store.list_series():
+            for columns, times, values in self.store.read(name, since):
+                series = self.get_series(name, columns)
+                # Segments written before the columns changed do not fit
+                if series is None or series.columns != list(columns):
+                    continue
+                series.extend(times, values)
+                metric = metrics.get(name, name.partition("/")[0])
+                self.last_times[metric] = max(
+                    self.last_times.get(metric, float("-inf")), float(times[-1])
+                )
+
+    def get_metric_series(self, metric):
+        if metric == "cpu":
+            return {"cpu": self.cpu}
+        if metric == "memory":
+            return {"memory": self.memory, "swap": self.swap}
+        group = {"disk": self.disk, "network": self.network, "diskio": self.diskio}.get(metric, {})
+        return {f"{metric}/{key}": series for key, series in group.items()}
+
+    def missing_rollups(self, metric):
+        return {
+            name: series
+            for name, series in self.get_metric_series(metric).items()
+            if series.tiers is None and name not in self.loading
+        }
+
+    async def load_rollups(self, metric):
+        series = self.missing_rollups(metric)
+        if not series:
+            return
+        self.loading.update(series)
+        try:
+            tiers = await asyncio.get_running_loop().run_in_executor(
+                None, self.build_rollups, {name: s.create_tiers() for name, s in series.items()}
+            )
+        finally:
+            self.loading.difference_update(series)
+        for name, built in tiers.items():
+            series[name].start_tiers(built)
+
+    def build_rollups(self, tiers):
+        # Runs on a worker thread and only touches the new tiers and the store
+        if self.store is None:
+            return tiers
+        longest = max(width * count for width, count in ROLLUP_TIERS)
+        since = time.time() - longest
+        for name, built in tiers.items():
+            # Reading flushes what is still buffered, samples appended later
+            # are taken from the raw ring by start_tiers
+            for columns, times, values in self.store.read(name, since):
+                if list(columns) == built[0].columns:
+                    built[0].extend(times, values)
+        return tiers
+
+    def append(self, name, series, timestamp, values):
+        series.append(timestamp, values)
+        if self.store is not None:
+            self.store.append(name, timestamp, values, series.columns)
+
+    def record(self, metric, result):
+        if result is None:
+            return
+
+        # Subscribing replays the latest results, do not store a sample twice
+        timestamp = result[0]
+        if timestamp <= self.last_times.get(metric, float("-inf")):
+            return
+        self.last_times[metric] = timestamp
+
+        handlers = {
+            "cpu": self.record_cpu,
+            "memory": self.record_memory,
+            "disk": self.record_disk,
+            "network": self.record_network,
+            "diskio": self.record_diskio,
+        }
+        handlers[metric](*result)
+
+    def record_cpu(self, timestamp, cpu_metrics):
+        self.append(
+            "cpu", self.cpu, timestamp, [cpu_metrics.get(metric, 0) for metric in CPU_METRICS]
+        )
+
+        per_core_load = cpu_metrics.get("per_core_load")
+        if per_core_load is not None:
+            num_cores = len(per_core_load)
+            if self.cores is None or len(self.cores.columns) != num_cores:
+                self.cores = RingSeries(
+                    CORE_HEATMAP_SAMPLES, [f"cpu{core}" for core in range(num_cores)]
+                )
+            # Only the last CORE_HEATMAP_SAMPLES are ever drawn, a column per
+            # core is too much to keep on disk for that
+            self.cores.append(timestamp, per_core_load)
+
+    def record_memory(self, timestamp, memory_metrics, swap_metrics):
+        self.append("memory", self.memory, timestamp, memory_metrics["used_percent"])
+        self.append("swap", self.swap, timestamp, swap_metrics["used_percent"])
+
+    def record_disk(self, timestamp, volumes):
+        for volume in volumes:
+            self.volumes[volume.filesystem] = volume
+            if volume.filesystem not in self.disk:
+                self.disk[volume.filesystem] = TieredSeries(columns=["usage_percent"])
+            self.append(
+                f"disk/{volume.filesystem}",
+                self.disk[volume.filesystem],
+                timestamp,
+                volume.use_percent,
+            )
+
+    def record_network(self, timestamp, network_metrics):
+        for interface, rates in network_metrics.items():
+            if interface not in self.network:
+                self.network[interface] = TieredSeries(columns=InterfaceRates._fields)
+            self.append(f"network/{interface}", self.network[interface], timestamp, rates)
+
+    def record_diskio(self, timestamp, diskio_metrics):
+        for device, rates in diskio_metrics.items():
+            if device not in self.diskio:
+                self.diskio[device] = TieredSeries(columns=DeviceRates._fields)
+            self.append(f"diskio/{device}", self.diskio[device], timestamp, rates)
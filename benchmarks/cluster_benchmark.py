@@ -0,0 +1,206 @@
+import argparse
+import asyncio
+import contextlib
+import os
+import resource
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from metrics import SSHConnectionManager
+from sampling import DEFAULT_SAMPLE_BUDGET
+from fake_cluster import FakeCluster, ClusterThread
+
+NODE_COUNTS = [10, 100, 500, 1000, 2000, 5000]
+DURATION = 15
+MAX_CONCURRENCY = 50
+
+
+# Records how long every batched collection takes from the client's side
+class TimedManager(SSHConnectionManager):
+    def __init__(self):
+        super().__init__()
+        self.latencies = []
+
+    async def collect_metrics(self, node_info, metrics):
+        start = time.perf_counter()
+        try:
+            return await super().collect_metrics(node_info, metrics)
+        finally:
+            self.latencies.append(time.perf_counter() - start)
+
+
+def percentiles(values, points=(50, 95, 99)):
+    if not values:
+        return [0] * len(points)
+    return np.percentile(values, points) * 1000
+
+
+def raise_file_limit(nodes):
+    # Every node holds a client and a server socket in this one process
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    wanted = min(hard, max(soft, 2 * nodes + 256))
+    if wanted > soft:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (wanted, hard))
+    if wanted < 2 * nodes + 256:
+        print(f"Open file limit {wanted} may be too low for {nodes} nodes", file=sys.stderr)
+
+
+async def run_benchmark(port, nodes, duration, max_concurrency, sample_budget):
+    manager = TimedManager()
+    manager.policy.budget = sample_budget
+    node_infos = [
+        {
+            "name": f"node{index}",
+            "host": "127.0.0.1",
+            "port": port,
+            "user": f"node{index}",
+            "password": "benchmark",
+            "use_key": False,
+        }
+        for index in range(nodes)
+    ]
+
+    semaphore = asyncio.Semaphore(max_concurrency)
+    setup_times = []
+
+    async def connect(node_info):
+        async with semaphore:
+            start = time.perf_counter()
+            ssh_client, connected = await manager.get_ssh_connection(node_info)
+            setup_times.append(time.perf_counter() - start)
+        return connected
+
+    cpu_start = time.thread_time()
+    start = time.perf_counter()
+    connected = sum(await asyncio.gather(*(connect(node_info) for node_info in node_infos)))
+    setup_wall = time.perf_counter() - start
+    setup_cpu = time.thread_time() - cpu_start
+
+    samples = 0
+    failures = 0
+    planned = []
+
+    def on_metrics(metric, result):
+        nonlocal samples, failures
+        if result is None:
+            failures += 1
+        else:
+            samples += 1
+
+    manager.latencies.clear()
+    cpu_start = time.thread_time()
+    start = time.perf_counter()
+    for node_info in node_infos:
+        manager.subscribe_metrics(node_info, on_metrics)
+    # The sampling policy changes the rate as nodes heat up and settle down
+    for _ in range(int(duration)):
+        await asyncio.sleep(1)
+        planned.append(manager.policy.planned)
+    await asyncio.sleep(duration - int(duration))
+    elapsed = time.perf_counter() - start
+    collect_cpu = time.thread_time() - cpu_start
+
+    for node_info in node_infos:
+        manager.unsubscribe_metrics(node_info, on_metrics)
+    await manager.close_all_connections()
+
+    return {
+        "nodes": nodes,
+        "connected": connected,
+        "setup_wall": setup_wall,
+        "setup_cpu": setup_cpu,
+        "setup_percentiles": percentiles(setup_times),
+        "samples_per_second": samples / elapsed,
+        "failures_per_second": failures / elapsed,
+        "planned_per_second": np.mean(planned) if planned else manager.policy.planned,
+        "latency_percentiles": percentiles(manager.latencies),
+        "cpu_percent": collect_cpu / elapsed * 100,
+    }
+
+
+def print_result(result):
+    print(
+        f"{result['nodes']:>5} nodes: connected {result['connected']} in "
+        f"{result['setup_wall']:.1f} s ({result['setup_cpu']:.1f} s CPU, "
+        "p50/p95/p99 {:.0f}/{:.0f}/{:.0f} ms)".format(*result["setup_percentiles"])
+    )
+    print(
+        f"       {result['samples_per_second']:.1f} samples/s of "
+        f"{result['planned_per_second']:.1f} planned, "
+        f"{result['failures_per_second']:.1f} failed/s, "
+        "latency p50/p95/p99 {:.1f}/{:.1f}/{:.1f} ms, ".format(*result["latency_percentiles"])
+        + f"client CPU {result['cpu_percent']:.0f}%"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Collect metrics from a simulated cluster on loopback"
+    )
+    parser.add_argument(
+        "--nodes", type=int, nargs="+", default=NODE_COUNTS, help="cluster sizes to run"
+    )
+    parser.add_argument(
+        "--duration", type=float, default=DURATION, help="seconds of collection per size"
+    )
+    parser.add_argument(
+        "--latency", type=float, default=0.005, help="seconds a simulated command takes"
+    )
+    parser.add_argument(
+        "--jitter", type=float, default=0.5, help="latency spread as a share of --latency"
+    )
+    parser.add_argument(
+        "--failure-rate", type=float, default=0.0, help="share of commands that exit with an error"
+    )
+    parser.add_argument(
+        "--disconnect-rate", type=float, default=0.0, help="share of commands that drop the connection"
+    )
+    parser.add_argument(
+        "--hang-rate", type=float, default=0.0, help="share of commands whose df hangs"
+    )
+    parser.add_argument(
+        "--max-concurrency",
+        type=int,
+        default=MAX_CONCURRENCY,
+        help="connections opened at once during setup",
+    )
+    parser.add_argument(
+        "--sample-budget",
+        type=float,
+        default=DEFAULT_SAMPLE_BUDGET,
+        help="samples per second the sampling policy shares out",
+    )
+    parser.add_argument(
+        "--verbose", action="store_true", help="show the connection messages of the manager"
+    )
+    args = parser.parse_args()
+
+    raise_file_limit(max(args.nodes))
+    cluster = FakeCluster(
+        args.latency, args.jitter, args.failure_rate, args.disconnect_rate, args.hang_rate
+    )
+    server = ClusterThread(cluster)
+    port = server.start()
+    print(f"Simulated cluster listening on 127.0.0.1:{port}")
+
+    try:
+        for nodes in args.nodes:
+            # The manager reports every connection, which drowns out the results
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(
+                devnull if not args.verbose else sys.stdout
+            ):
+                result = asyncio.run(
+                    run_benchmark(
+                        port, nodes, args.duration, args.max_concurrency, args.sample_budget
+                    )
+                )
+            print_result(result)
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
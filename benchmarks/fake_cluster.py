@@ -0,0 +1,285 @@
+import asyncio
+import random
+import shlex
+import threading
+import time
+import asyncssh
+
+USER_HZ = 100
+
+
+# Synthetic /proc and df output of one node. Counters advance with the time
+# between reads, so rates computed from consecutive samples look plausible
+class FakeNode:
+    def __init__(self, seed):
+        self.random = random.Random(seed)
+        self.cores = self.random.choice([2, 4, 8, 16])
+        self.boot_time = time.time() - self.random.uniform(1e3, 1e6)
+        self.last_update = time.time()
+        self.busy = self.random.uniform(0.05, 0.9)
+        self.cpu_times = [[0] * 8 for _ in range(self.cores)]
+        self.mem_total = self.random.choice([4, 8, 16, 64]) * 1024 * 1024
+        self.swap_total = self.random.choice([0, 2 * 1024 * 1024])
+        self.interfaces = {
+            "lo": [0, 0, 1e4],
+            "eth0": [0, 0, self.random.uniform(1e4, 1e8)],
+        }
+        self.devices = {
+            "sda": [0, 0, 0, 0, self.random.uniform(1, 500)],
+            "sda1": [0, 0, 0, 0, 0],
+        }
+        self.filesystems = [
+            ["/dev/sda1", 250 * 1024 * 1024, self.random.uniform(0.1, 0.9), "/"],
+            ["/dev/sdb1", 1024 * 1024 * 1024, self.random.uniform(0.1, 0.9), "/data"],
+            ["tmpfs", 1024 * 1024, 0.01, "/run"],
+        ]
+
+    def advance(self):
+        now = time.time()
+        elapsed = now - self.last_update
+        self.last_update = now
+        ticks = int(elapsed * USER_HZ)
+
+        for core in self.cpu_times:
+            busy = int(ticks * min(1.0, max(0.0, self.random.gauss(self.busy, 0.1))))
+            user = int(busy * 0.7)
+            system = busy - user
+            core[0] += user
+            core[2] += system
+            core[3] += ticks - busy
+
+        for counters in self.interfaces.values():
+            rate = counters[2]
+            counters[0] += int(rate * elapsed * self.random.uniform(0.5, 1.5))
+            counters[1] += int(rate * elapsed * self.random.uniform(0.1, 0.5))
+
+        for counters in self.devices.values():
+            ops = counters[4] * elapsed
+            reads = int(ops * self.random.uniform(0.2, 0.8))
+            writes = int(ops) - reads
+            counters[0] += reads
+            counters[1] += reads * 8
+            counters[2] += writes
+            counters[3] += writes * 8
+
+    def uptime(self):
+        uptime = time.time() - self.boot_time
+        return f"{uptime:.2f} {uptime * self.cores * 0.9:.2f}\n"
+
+    def stat(self):
+        totals = [sum(column) for column in zip(*self.cpu_times)]
+        lines = ["cpu  " + " ".join(str(value) for value in totals) + " 0 0"]
+        for index, core in enumerate(self.cpu_times):
+            lines.append(f"cpu{index} " + " ".join(str(value) for value in core) + " 0 0")
+        lines.append("intr 0")
+        lines.append("ctxt 0")
+        lines.append(f"btime {int(self.boot_time)}")
+        return "\n".join(lines) + "\n"
+
+    def loadavg(self):
+        load = self.busy * self.cores
+        return f"{load:.2f} {load * 0.9:.2f} {load * 0.8:.2f} 2/{200 + self.cores} 12345\n"
+
+    def meminfo(self):
+        free = int(self.mem_total * self.random.uniform(0.1, 0.5))
+        cached = int(self.mem_total * 0.2)
+        swap_free = int(self.swap_total * self.random.uniform(0.5, 1.0))
+        fields = [
+            ("MemTotal", self.mem_total),
+            ("MemFree", free),
+            ("MemAvailable", free + cached),
+            ("Buffers", int(self.mem_total * 0.02)),
+            ("Cached", cached),
+            ("SwapCached", 0),
+            ("Shmem", int(self.mem_total * 0.01)),
+            ("SReclaimable", int(self.mem_total * 0.01)),
+            ("SwapTotal", self.swap_total),
+            ("SwapFree", swap_free),
+        ]
+        return "".join(f"{name}:{value:>16} kB\n" for name, value in fields)
+
+    def net_dev(self):
+        lines = [
+            "Inter-|   Receive                                                |  Transmit",
+            " face |bytes    packets errs drop fifo frame compressed multicast|bytes    packets errs drop fifo colls carrier compressed",
+        ]
+        for name, (received, sent, _) in self.interfaces.items():
+            lines.append(
+                f"{name:>6}: {received} {received // 1000} 0 0 0 0 0 0 "
+                f"{sent} {sent // 1000} 0 0 0 0 0 0"
+            )
+        return "\n".join(lines) + "\n"
+
+    def diskstats(self):
+        lines = []
+        for minor, (name, (reads, read_sectors, writes, write_sectors, _)) in enumerate(
+            self.devices.items()
+        ):
+            lines.append(
+                f"   8       {minor} {name} {reads} 0 {read_sectors} {reads // 2} "
+                f"{writes} 0 {write_sectors} {writes // 2} 0 {(reads + writes) // 3} "
+                f"{reads + writes} 0 0 0 0"
+            )
+        return "\n".join(lines) + "\n"
+
+    def df(self):
+        lines = ["Filesystem     1024-blocks      Used Available Capacity Mounted on"]
+        for filesystem, size, used_share, mounted_on in self.filesystems:
+            used = int(size * used_share)
+            lines.append(
+                f"{filesystem} {size} {used} {size - used} {round(used_share * 100)}% {mounted_on}"
+            )
+        return "\n".join(lines) + "\n"
+
+    def read_file(self, path):
+        files = {
+            "/proc/uptime": self.uptime,
+            "/proc/stat": self.stat,
+            "/proc/loadavg": self.loadavg,
+            "/proc/meminfo": self.meminfo,
+            "/proc/net/dev": self.net_dev,
+            "/proc/diskstats": self.diskstats,
+        }
+        return files[path]()
+
+    # Understands the "echo; cat; df" command lists the collectors send. With
+    # hang_df the output stops where df would block, and status is None
+    def run(self, command, hang_df=False):
+        self.advance()
+        output = []
+        for part in command.split(";"):
+            args = shlex.split(part)
+            if args and args[0] == "timeout":
+                # timeout [-s SIGNAL] DURATION COMMAND...
+                args = args[4:] if args[1] == "-s" else args[2:]
+            if not args:
+                continue
+            if args[0] == "df" and hang_df:
+                return "".join(output), "", None
+            if args[0] == "echo":
+                output.append(" ".join(args[1:]) + "\n")
+            elif args[0] == "cat":
+                try:
+                    output.extend(self.read_file(path) for path in args[1:])
+                except KeyError as e:
+                    return "".join(output), f"cat: {e.args[0]}: No such file or directory\n", 1
+            elif args[0] == "df":
+                output.append(self.df())
+            else:
+                return "".join(output), f"sh: {args[0]}: command not found\n", 127
+        return "".join(output), "", 0
+
+
+# Every username is a separate node, so N nodes can share one listening port
+class FakeCluster:
+    def __init__(
+        self,
+        latency=0.005,
+        jitter=0.5,
+        failure_rate=0.0,
+        disconnect_rate=0.0,
+        hang_rate=0.0,
+        hang_duration=60,
+        seed=0,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.disconnect_rate = disconnect_rate
+        self.hang_rate = hang_rate
+        self.hang_duration = hang_duration
+        self.random = random.Random(seed)
+        self.nodes = {}
+        self.commands = 0
+        self.failures = 0
+        self.disconnects = 0
+        self.hangs = 0
+
+    def get_node(self, username):
+        if username not in self.nodes:
+            self.nodes[username] = FakeNode(username)
+        return self.nodes[username]
+
+    def create_server(self):
+        class Server(asyncssh.SSHServer):
+            def begin_auth(self, username):
+                return True
+
+            def password_auth_supported(self):
+                return True
+
+            def validate_password(self, username, password):
+                return True
+
+        return Server()
+
+    async def handle_process(self, process):
+        self.commands += 1
+        node = self.get_node(process.get_extra_info("username"))
+
+        if self.latency:
+            spread = self.latency * self.jitter
+            await asyncio.sleep(max(0, self.random.uniform(self.latency - spread, self.latency + spread)))
+
+        if self.random.random() < self.disconnect_rate:
+            self.disconnects += 1
+            process.channel.get_connection().abort()
+            return
+
+        if self.random.random() < self.failure_rate:
+            self.failures += 1
+            process.stderr.write("simulated failure\n")
+            process.exit(1)
+            return
+
+        # Like df on a dead NFS mount: the command stops answering until the
+        # client gives up and closes the channel
+        hang_df = self.random.random() < self.hang_rate
+        stdout, stderr, status = node.run(process.command, hang_df)
+        process.stdout.write(stdout)
+        if status is None:
+            self.hangs += 1
+            try:
+                await asyncio.wait_for(process.channel.wait_closed(), self.hang_duration)
+                return
+            except asyncio.TimeoutError:
+                status = 137
+        if stderr:
+            process.stderr.write(stderr)
+        process.exit(status)
+
+    async def start(self, host="127.0.0.1", port=0):
+        key = asyncssh.generate_private_key("ssh-ed25519")
+        self.server = await asyncssh.create_server(
+            self.create_server,
+            host,
+            port,
+            server_host_keys=[key],
+            process_factory=self.handle_process,
+            keepalive_interval=0,
+        )
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self.port
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+
+# Runs the fake cluster on its own event loop thread, so the CPU time of the
+# client thread can be measured separately from the simulated servers
+class ClusterThread:
+    def __init__(self, cluster):
+        self.cluster = cluster
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+
+    def start(self, host="127.0.0.1", port=0):
+        self.thread.start()
+        future = asyncio.run_coroutine_threadsafe(self.cluster.start(host, port), self.loop)
+        return future.result()
+
+    def stop(self):
+        asyncio.run_coroutine_threadsafe(self.cluster.stop(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
@@ -0,0 +1,156 @@
+import argparse
+import gc
+import json
+import os
+import sys
+import timeit
+import tracemalloc
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+FIXTURE_DIR = os.path.join(BENCHMARK_DIR, "fixtures")
+sys.path.insert(0, os.path.join(BENCHMARK_DIR, "..", "app"))
+
+from metrics import SSHConnectionManager, SECTION_MARKER
+
+REPEAT = 5
+# Fixture files are named after the source they were read from, e.g. df_vm.txt
+FIXTURE_SOURCES = ("stat", "meminfo", "df", "netdev", "diskstats", "system_info")
+
+
+def load_fixtures():
+    fixtures = {}
+    for filename in sorted(os.listdir(FIXTURE_DIR)):
+        name, extension = os.path.splitext(filename)
+        source = next(
+            (source for source in FIXTURE_SOURCES if name.startswith(source + "_")), None
+        )
+        if extension != ".txt" or source is None:
+            continue
+        with open(os.path.join(FIXTURE_DIR, filename)) as f:
+            # The manager strips command output before parsing it
+            fixtures[name] = (source, f.read().strip())
+    return fixtures
+
+
+def build_batch_output(fixtures, suffix):
+    sections = []
+    for source in ("stat", "meminfo", "df", "netdev", "diskstats"):
+        sections.append(f"{SECTION_MARKER}{source}\n{fixtures[f'{source}_{suffix}'][1]}")
+    return f"{SECTION_MARKER}clock\n12345.67 23456.78\n" + "\n".join(sections)
+
+
+def build_cases(manager, fixtures, selected=None):
+    parsers = {
+        "stat": [("parse_proc_stat", manager.parse_proc_stat)],
+        "meminfo": [("parse_meminfo", manager.parse_meminfo)],
+        "df": [("parse_df_output", manager.parse_df_output)],
+        "netdev": [("parse_network_stats", manager.parse_network_stats)],
+        "diskstats": [("parse_diskio_stats", manager.parse_diskio_stats)],
+        "system_info": [("parse_system_info", manager.parse_system_info)],
+    }
+
+    cases = []
+    for name, (source, output) in fixtures.items():
+        for parser_name, parser in parsers[source]:
+            cases.append((parser_name, name, parser, output))
+        if source == "df":
+            volumes = manager.parse_df_output(output)
+            cases.append(("filter_volumes", name, manager.filter_volumes, volumes))
+    for suffix in ("vm", "large_host"):
+        try:
+            output = build_batch_output(fixtures, suffix)
+        except KeyError:
+            continue
+        cases.append(("split_sections", f"batch_{suffix}", manager.split_sections, output))
+
+    if selected:
+        cases = [case for case in cases if case[0] in selected or case[1] in selected]
+    return cases
+
+
+def measure_time(parser, argument, repeat):
+    timer = timeit.Timer(lambda: parser(argument))
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat, number)) / number * 1e9
+
+
+def measure_allocations(parser, argument):
+    # Peak bytes allocated during one call and blocks still held by its result
+    gc.collect()
+    tracemalloc.start()
+    try:
+        blocks_before = sys.getallocatedblocks()
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        result = parser(argument)
+        peak = tracemalloc.get_traced_memory()[1] - baseline
+        retained_blocks = sys.getallocatedblocks() - blocks_before
+    finally:
+        tracemalloc.stop()
+    del result
+    return peak, retained_blocks
+
+
+def run(cases, repeat):
+    results = {}
+    for parser_name, fixture, parser, argument in cases:
+        peak, retained_blocks = measure_allocations(parser, argument)
+        results[f"{parser_name}/{fixture}"] = {
+            "ns_per_op": measure_time(parser, argument, repeat),
+            "peak_bytes": peak,
+            "retained_blocks": retained_blocks,
+        }
+    return results
+
+
+def format_change(value, baseline_value):
+    if not baseline_value:
+        return ""
+    return f"{(value - baseline_value) / baseline_value * 100:+.1f}%"
+
+
+def print_results(results, baseline=None):
+    width = max(len(key) for key in results)
+    print(f"{'parser/fixture':<{width}} {'ns/op':>12} {'peak B/op':>11} {'blocks/op':>10}")
+    for key, result in results.items():
+        line = (
+            f"{key:<{width}} {result['ns_per_op']:>12,.0f} "
+            f"{result['peak_bytes']:>11,} {result['retained_blocks']:>10,}"
+        )
+        if baseline and key in baseline:
+            line += (
+                f"  time {format_change(result['ns_per_op'], baseline[key]['ns_per_op']):>7}"
+                f"  peak {format_change(result['peak_bytes'], baseline[key]['peak_bytes']):>7}"
+            )
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Time the metric parsers against the recorded fixtures"
+    )
+    parser.add_argument(
+        "only", nargs="*", help="parsers or fixtures to run, e.g. parse_df_output df_vm"
+    )
+    parser.add_argument("--repeat", type=int, default=REPEAT, help="timing rounds, the best is kept")
+    parser.add_argument("--save", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="show changes against results saved with --save")
+    args = parser.parse_args()
+
+    manager = SSHConnectionManager()
+    cases = build_cases(manager, load_fixtures(), args.only)
+    results = run(cases, args.repeat)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+import os
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+
+from history_store import HEADER_SIZE, MAGIC, HistoryStore, Segment, SeriesStore
+
+
+class SegmentTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "segment.seg")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_round_trip(self):
+        segment = Segment.create(self.path, 100.0, ["a", "b"], rows=16)
+        times = np.arange(100.0, 110.0)
+        values = np.arange(20, dtype=np.float32).reshape(10, 2)
+        self.assertEqual(segment.append(times, values), 10)
+
+        reopened = Segment.open(self.path)
+        self.assertEqual(reopened.columns, ["a", "b"])
+        self.assertEqual(reopened.count, 10)
+        read_times, read_values = reopened.read()
+        np.testing.assert_array_equal(read_times, times)
+        np.testing.assert_array_equal(read_values, values)
+
+    def test_read_time_range(self):
+        segment = Segment.create(self.path, 0.0, ["a"], rows=16)
+        segment.append(np.arange(10.0), np.arange(10, dtype=np.float32).reshape(10, 1))
+        times, values = segment.read(3, 5)
+        np.testing.assert_array_equal(times, [3, 4, 5])
+        np.testing.assert_array_equal(values[:, 0], [3, 4, 5])
+
+    def test_append_stops_when_full(self):
+        segment = Segment.create(self.path, 0.0, ["a"], rows=4)
+        written = segment.append(np.arange(6.0), np.zeros((6, 1), np.float32))
+        self.assertEqual(written, 4)
+        self.assertEqual(Segment.open(self.path).count, 4)
+
+    def test_header_grows_with_columns(self):
+        columns = [f"cpu{core}" for core in range(1024)]
+        segment = Segment.create(self.path, 0.0, columns, rows=4)
+        self.assertGreater(segment.header_size, HEADER_SIZE)
+        self.assertEqual(segment.header_size % HEADER_SIZE, 0)
+        segment.append(np.array([1.0]), np.arange(1024, dtype=np.float32).reshape(1, -1))
+
+        reopened = Segment.open(self.path)
+        self.assertEqual(reopened.columns, columns)
+        np.testing.assert_array_equal(reopened.read()[1][0], np.arange(1024))
+
+    def test_rejects_other_files(self):
+        with open(self.path, "wb") as f:
+            f.write(b"not a segment".ljust(len(MAGIC) + 16, b"\0"))
+        with self.assertRaises(ValueError):
+            Segment.open(self.path)
+
+
+class SeriesStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "cpu")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def append(self, store, times, columns=("a", "b")):
+        for timestamp in times:
+            store.append(timestamp, [timestamp, -timestamp], columns)
+
+    def read_rows(self, store, start_time=None, end_time=None):
+        ranges = store.read(start_time, end_time)
+        if not ranges:
+            return np.empty(0), np.empty((0, 2))
+        return (
+            np.concatenate([times for _, times, _ in ranges]),
+            np.concatenate([values for _, _, values in ranges]),
+        )
+
+    def test_round_trip_across_segments(self):
+        store = SeriesStore(self.path, retention=86400)
+        # Three hours of samples every 10 s, one segment per hour
+        times = np.arange(0.0, 3 * 3600, 10.0)
+        self.append(store, times)
+        store.flush()
+
+        self.assertEqual(len(store.segment_paths()), 3)
+        read_times, read_values = self.read_rows(store)
+        np.testing.assert_array_equal(read_times, times)
+        np.testing.assert_array_equal(read_values[:, 0], times)
+        np.testing.assert_array_equal(read_values[:, 1], -times)
+
+        read_times, _ = self.read_rows(store, 3500, 3700)
+        np.testing.assert_array_equal(read_times, np.arange(3500.0, 3701.0, 10.0))
+
+    def test_resumes_newest_segment(self):
+        store = SeriesStore(self.path, retention=86400)
+        self.append(store, [1.0, 2.0])
+        store.flush()
+
+        reopened = SeriesStore(self.path, retention=86400)
+        self.append(reopened, [3.0])
+        reopened.flush()
+        self.assertEqual(len(reopened.segment_paths()), 1)
+        np.testing.assert_array_equal(self.read_rows(reopened)[0], [1, 2, 3])
+
+    def test_new_columns_start_a_new_segment(self):
+        store = SeriesStore(self.path, retention=86400)
+        self.append(store, [1.0])
+        self.append(store, [2.0], columns=("a", "c"))
+        store.flush()
+        columns = [columns for columns, _, _ in store.read()]
+        self.assertEqual(columns, [["a", "b"], ["a", "c"]])
+
+    def test_prunes_old_segments(self):
+        store = SeriesStore(self.path, retention=3600)
+        self.append(store, np.arange(0.0, 4 * 3600, 60.0))
+        store.flush()
+        # The last segment starts at 10800, everything before 7200 is older
+        # than the retention
+        read_times, _ = self.read_rows(store)
+        self.assertEqual(read_times[0], 7200)
+        self.assertEqual(len(store.segment_paths()), 2)
+
+
+class HistoryStoreTest(unittest.TestCase):
+    def test_failing_series_does_not_stop_the_others(self):
+        with tempfile.TemporaryDirectory() as directory:
+            store = HistoryStore(directory)
+            node = store.get_node({"host": "host", "user": "user", "name": "node"})
+            node.append("cpu", 1.0, [1.0], ["a"])
+            node.append("memory", 1.0, [2.0], ["a"])
+
+            def fail():
+                raise OSError("disk full")
+
+            node.get_series("cpu").flush = fail
+            results = store.write()
+            self.assertEqual(results, [("node", None)])
+            np.testing.assert_array_equal(node.read("memory")[0][2], [[2.0]])
+
+
+if __name__ == "__main__":
+    unittest.main()
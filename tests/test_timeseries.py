@@ -0,0 +1,107 @@
+import os
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+
+from timeseries import ROLLUP_STATS, RingSeries, TieredSeries
+
+# Small tiers keep the tests fast: 10 s, 1 min and 10 min buckets
+TIERS = ((10, 30), (60, 40), (600, 20))
+
+
+def make_series():
+    series = TieredSeries(capacity=100, columns=["x", "y"], tiers=TIERS)
+    series.tiers = series.create_tiers()
+    return series
+
+
+def make_samples(count, start=1000.0):
+    random = np.random.default_rng(0)
+    times = start + np.arange(count) + random.uniform(0, 0.5, count)
+    values = random.uniform(0, 100, (count, 2))
+    return times, values
+
+
+class RingSeriesTest(unittest.TestCase):
+    def test_extend_keeps_newest_rows(self):
+        series = RingSeries(capacity=5, columns=["x"])
+        series.extend(np.arange(8.0), np.arange(8.0).reshape(-1, 1))
+        times, values = series.window()
+        np.testing.assert_array_equal(times, [3, 4, 5, 6, 7])
+        np.testing.assert_array_equal(values[:, 0], [3, 4, 5, 6, 7])
+
+
+class TieredSeriesTest(unittest.TestCase):
+    def assert_same_tiers(self, expected, actual):
+        for expected_tier, actual_tier in zip(expected.tiers, actual.tiers):
+            self.assertEqual(expected_tier.count, actual_tier.count)
+            for stat in ROLLUP_STATS:
+                expected_times, expected_values = expected_tier.window(stat=stat)
+                actual_times, actual_values = actual_tier.window(stat=stat)
+                np.testing.assert_array_equal(expected_times, actual_times)
+                np.testing.assert_allclose(expected_values, actual_values, rtol=1e-5)
+
+    def test_tiers_match_brute_force(self):
+        times, values = make_samples(5000)
+        series = make_series()
+        for timestamp, row in zip(times, values):
+            series.append(timestamp, row)
+
+        for tier in series.tiers:
+            buckets = times - times % tier.width
+            bucket_times, means = tier.window(stat="mean")
+            _, highs = tier.window(stat="max")
+            _, lasts = tier.window(stat="last")
+            # The newest bucket is still open and may lag the samples
+            for index in range(len(bucket_times) - 1):
+                selected = buckets == bucket_times[index] - tier.width / 2
+                np.testing.assert_allclose(means[index], values[selected].mean(axis=0), rtol=1e-5)
+                np.testing.assert_allclose(highs[index], values[selected].max(axis=0), rtol=1e-5)
+                np.testing.assert_allclose(lasts[index], values[selected][-1], rtol=1e-5)
+
+    def test_bulk_then_stream_matches_stream(self):
+        times, values = make_samples(5000)
+        streamed = make_series()
+        for timestamp, row in zip(times, values):
+            streamed.append(timestamp, row)
+
+        loaded = make_series()
+        split = 3217
+        # Chunks that do not line up with any bucket width
+        for start in range(0, split, 499):
+            end = min(start + 499, split)
+            loaded.extend(times[start:end], values[start:end])
+        for timestamp, row in zip(times[split:], values[split:]):
+            loaded.append(timestamp, row)
+
+        self.assert_same_tiers(streamed, loaded)
+
+    def test_start_tiers_catches_up_from_raw_samples(self):
+        times, values = make_samples(600)
+        streamed = make_series()
+        for timestamp, row in zip(times, values):
+            streamed.append(timestamp, row)
+
+        # Tiers built from the first samples only, the raw ring holds all
+        lazy = TieredSeries(capacity=1000, columns=["x", "y"], tiers=TIERS)
+        for timestamp, row in zip(times, values):
+            lazy.append(timestamp, row)
+        self.assertIs(lazy.resolution(3600), lazy)
+        built = lazy.create_tiers()
+        built[0].extend(times[:400], values[:400])
+        lazy.start_tiers(built)
+
+        self.assert_same_tiers(streamed, lazy)
+
+    def test_resolution_picks_covering_tier(self):
+        series = make_series()
+        self.assertIs(series.resolution(600), series)
+        self.assertIs(series.resolution(1800), series.tiers[1])
+        self.assertIs(series.resolution(86400), series.tiers[2])
+
+
+if __name__ == "__main__":
+    unittest.main()